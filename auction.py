@@ -9,22 +9,36 @@
 
 from optparse import OptionParser
 import copy
+import hashlib
+import inspect
 import itertools
 import logging
 import math
 import pprint
 import random
 import sys
+import time
+from timeit import default_timer
 
 from gsp import GSP
 from vcg import VCG
-from history import History
+from history import History, BidSummary, Round, RoundWindow
+from metrics import Metrics
+from remoteagent import is_remote, remote_class, gather_bids
+import checkpoint
+import replay
+import scenarios
+import simtrace
 from stats import Stats
+from streamstats import RunningStat
+from timeseries import RoundSeries
+from timing import BidTimer
+from truthful import Truthful
 
 #from bbagent import BBAgent
 #from truthfulagent import TruthfulAgent
 
-from util import argmax_index, shuffled, mean, stddev
+from util import argmax_index, distinct_assignments
 
 # Infinite stream of zeros
 zeros = itertools.repeat(0)
@@ -42,10 +56,126 @@ def agent_slot(occupants, a_id, t):
     else:
         return -1
 
+def is_static_bidder(agent):
+    """Return True if agent's bid ignores t and history, so the engine
+    can ask for it once and reuse it every round.
 
-def sim(config):
-    # TODO: Create agents here
-    agents = init_agents(config)
+    Agents opt in (or out) with a static_bid attribute.  Otherwise,
+    agents whose bid() is Truthful.bid are detected as static."""
+    declared = getattr(agent, 'static_bid', None)
+    if declared is not None:
+        return bool(declared)
+    bid = getattr(agent.__class__, 'bid', None)
+    return (isinstance(agent, Truthful) and
+            getattr(bid, 'im_func', None) is Truthful.bid.im_func)
+
+
+def dense_history_classes(agent_classes):
+    """Names of the agent classes (an iterable) that read every agent's
+    bid from the history, and so can't run with --sparse-history.  They
+    declare it with a needs_all_bids attribute."""
+    return sorted(set(c.__name__ for c in agent_classes
+                      if getattr(c, 'needs_all_bids', False)))
+
+
+def is_resettable(agent_class):
+    """Return True if agents of agent_class can be reused for another
+    simulation by calling their reset(value, budget).  A subclass that
+    redefines __init__ but not reset may keep state reset doesn't know
+    about, so it isn't."""
+    def defined_in(name):
+        for c in inspect.getmro(agent_class):
+            if name in c.__dict__:
+                return c
+        return None
+    reset = defined_in('reset')
+    return reset is not None and issubclass(reset, defined_in('__init__'))
+
+
+class Workspace:
+    """
+    Agents and round storage kept from one simulation to the next, for
+    runs of many simulations: agents that can be are reset rather than
+    made again (see is_resettable), and the round store is emptied
+    rather than allocated again.  A History from a workspace's store is
+    only good until the next simulation.
+    """
+    def __init__(self):
+        self.agents = None
+        self.classes = None
+        self.store = None
+        self.window = None
+
+    def agents_for(self, config):
+        """Agents for a simulation of config"""
+        classes = [config.agent_classes[name]
+                   for name in config.agent_class_names]
+        if (self.agents is not None and classes == self.classes and
+            all(is_resettable(c) for c in classes)):
+            for (a, value) in zip(self.agents, config.agent_values):
+                a.reset(value, config.budget)
+        else:
+            self.agents = init_agents(config)
+            self.classes = classes
+        return self.agents
+
+    def round_store(self, window):
+        """An empty round -> Round store for sim() to fill in"""
+        if self.store is None or window != self.window:
+            self.store = RoundWindow(window) if window else {}
+            self.window = window
+        else:
+            self.store.clear()
+        return self.store
+
+
+class Snapshot:
+    """
+    A simulation stopped before round t (see sim's stop argument): the
+    agents, history, spend ledger, standing bids and random state it
+    carries into the rest of the day.
+    """
+    def __init__(self, t, agents, rounds, spent, agents_spent,
+                 agents_utility, revenue, current_bids, broke):
+        self.t = t
+        self.agents = agents
+        # round -> Round
+        self.rounds = rounds
+        self.spent = spent
+        self.agents_spent = agents_spent
+        self.agents_utility = agents_utility
+        self.revenue = revenue
+        self.current_bids = current_bids
+        self.broke = broke
+        self.rng_state = random.getstate()
+
+
+def sim(config, agents=None, start=None, stop=None, store=None):
+    """Runs one day of config.num_rounds rounds and returns its History.
+    agents are made from config unless given; given agents are left
+    running for the caller to close (see sim_days).
+
+    With stop, only the rounds before stop are run, and a Snapshot of
+    the simulation is returned instead.  start continues from a Snapshot
+    under config, which may differ from the one the snapshot was taken
+    under (in its reserve or mechanism, say).  The snapshot isn't
+    changed, so it can be continued any number of times.
+
+    store is an empty round -> Round store to fill in (see Workspace)
+    rather than a new one."""
+    own_agents = agents is None
+    if start is not None:
+        start = copy.deepcopy(start)
+        agents = start.agents
+    elif own_agents:
+        agents = init_agents(config)
+    if stop is not None and any(is_remote(a) for a in agents):
+        raise ValueError("Simulations with remote agents can't be "
+                         "snapshotted")
+    shadow_names = getattr(config, 'shadow_mechanisms', [])
+    if shadow_names and (start is not None or stop is not None):
+        raise ValueError("Simulations with shadow mechanisms can't be "
+                         "snapshotted")
     # Uncomment to print agents.
     #for a in agents:
     #    logging.info(a)
@@ -64,111 +194,321 @@ def sim(config):
 
     reserve = config.reserve
 
-    # Dictionaries : round # -> per_slot_list_of_whatever
-    slot_occupants = {}
-    slot_clicks = {}
-    per_click_payments = {}
-    slot_payments = {}
-    values = {}
-    bids = {}
+    # Round # -> Round.  With a history window only the last few rounds
+    # are kept.
+    window = getattr(config, 'history_window', None)
+    def new_store():
+        return RoundWindow(window) if window else {}
+    if start is not None:
+        rounds = start.rounds
+    elif store is not None:
+        rounds = store
+    else:
+        rounds = new_store()
 
-    history = History(bids, slot_occupants, slot_clicks,
-                      per_click_payments, slot_payments, n)
+    history = History.of_rounds(rounds, n, window)
+    if start is not None:
+        history.agents_spent = start.agents_spent
+        history.agents_utility = start.agents_utility
+        history.revenue = start.revenue
+    utility = history.agents_utility
+    metrics = history.metrics = Metrics()
 
-    def total_spent(agent_id, end):
-        """
-        Compute total amount spent by agent_id through (not including)
-        round end.
-        """
-        s = 0
-        for t in range(end):
-            slot = agent_slot(slot_occupants, agent_id, t)
-            if slot != -1:
-                s += slot_payments[t][slot]
-        return s
+    # Shadow mechanisms price every round's bids too, without the agents
+    # seeing the outcome.  Each gets a History of its own, whose rounds
+    # share the live bids and clicks.
+    shadows = []
+    for name in shadow_names:
+        shadow = History.of_rounds(new_store(), n, window)
+        history.shadows[name] = shadow
+        shadows.append((replay.MECHANISMS[name], shadow))
+    phase_time = metrics.phase_time
+
+    # Running spend ledger: id -> amount spent in the rounds run so far
+    spent = dict(zip(agent_ids, zeros)) if start is None else start.spent
+
+    # History-independent bidders are asked for their bid once; their
+    # entries in current_bids only change when they run out of money.
+    use_fast_path = getattr(config, 'static_fast_path', True)
+    static = set(a.id for a in agents
+                 if use_fast_path and is_static_bidder(a))
+    strategic = [(i, a) for (i, a) in enumerate(agents) if a.id not in static]
+    # Out-of-process agents are asked for their bids all at once, and
+    # have bid_deadline seconds per round to answer.
+    remote = [(i, a) for (i, a) in strategic if is_remote(a)]
+    strategic = [(i, a) for (i, a) in strategic if not is_remote(a)]
+    deadline = getattr(config, 'bid_deadline', None)
+    index_of = dict((a.id, i) for (i, a) in enumerate(agents))
+    current_bids = [None] * n if start is None else start.current_bids
+    broke = set() if start is None else start.broke
+
+    # Optional wall-time accounting, shared across simulations by main()
+    timer = getattr(config, 'bid_timer', None)
+    # Optional per-round trace (a simtrace.Tracer)
+    tracer = getattr(config, 'tracer', None)
+    tracing = tracer is not None and tracer.start_sim(
+        dict((a.id, a.value) for a in agents), config.mechanism, reserve)
+
+    def initial_bid_of(a):
+        metrics.agent_calls += 1
+        if timer is None:
+            return a.initial_bid(reserve)
+        return timer.call(a, 'initial_bid', 0, reserve)
+
+    def remote_bids(t):
+        """Gather the remote agents' bids for round t.  Those that are
+        late or fail keep their previous bid (zero in round 0)."""
+        if not remote:
+            return
+        metrics.agent_calls += len(remote)
+        replies = gather_bids([a for (_, a) in remote], t, history,
+                              reserve, deadline)
+        for (i, a) in remote:
+            previous = current_bids[i][1] if t > 0 else 0
+            yield (i, a, replies.get(a.id, previous))
+
+    def bid_of(i, a, t):
+        metrics.agent_calls += 1
+        if timer is None:
+            return a.bid(t, history, reserve)
+        # Agents over the time limit keep their previous bid
+        return timer.call(a, 'bid', current_bids[i][1], t, history, reserve)
+
+    ##   1a.   Define no. of slots  (TO-DO: Check what the # of available slots should be)
+    #num_slots = max(1, active_bidders-1)
+    num_slots = getattr(config, 'num_slots', None) or max(1, n-1)
+
+    # Large-population mode: only the winners and the first loser are
+    # recorded in the history, the rest of the bids as a BidSummary.
+    sparse = getattr(config, 'sparse_history', False)
+    if sparse:
+        dense = dense_history_classes(a.__class__ for a in agents)
+        if dense:
+            raise ValueError("Agents that need every bid in the history "
+                             "can't run with --sparse-history: %s" %
+                             ", ".join(dense))
 
     def run_round(top_slot_clicks, t):
         """ top_slot_clicks is the expected number of clicks in the top slot
             k is the round number
         """
+        start = default_timer()
         if t == 0:
-            bids[t] = [(a.id, a.initial_bid(reserve)) for a in agents]
+            for (i, a) in enumerate(agents):
+                if not is_remote(a):
+                    current_bids[i] = (a.id, initial_bid_of(a))
+            for (i, a, b) in remote_bids(t):
+                current_bids[i] = (a.id, b)
         else:
-            # Bids from agents with no money get reduced to zero
-            have_money = lambda a: total_spent(a.id, t) < config.budget
-            still_have_money = filter(have_money, agents)
-            current_bids = []
-            
-            for a in agents:
-                b = a.bid(t, history, reserve)
-                if total_spent(a.id, t) < config.budget:
-                    current_bids.append( (a.id, b))
+            if t == 1:
+                for (i, a) in enumerate(agents):
+                    if a.id in static:
+                        current_bids[i] = (a.id, bid_of(i, a, t))
+            else:
+                metrics.cache_hits += len(static)
+            # Bids from agents with no money get reduced to zero.  Only
+            # last round's occupants can have just run out.
+            for agent_id in rounds[t-1].occupants:
+                if agent_id in static and agent_id not in broke and (
+                        spent[agent_id] >= config.budget):
+                    # Out of money: make bid zero.
+                    current_bids[index_of[agent_id]] = (agent_id, 0)
+                    broke.add(agent_id)
+            new_bids = [(i, a, bid_of(i, a, t)) for (i, a) in strategic]
+            new_bids.extend(remote_bids(t))
+            for (i, a, b) in new_bids:
+                if spent[a.id] < config.budget:
+                    current_bids[i] = (a.id, b)
                 else:
                     # Out of money: make bid zero.
-                    current_bids.append( (a.id, 0))
-            bids[t] = current_bids
-
-        ##   Ignore those below reserve price
-        active_bidders = len(filter(lambda (i,b): b >= reserve, bids[t]))
-        #####################################
-        ##   1a.   Define no. of slots  (TO-DO: Check what the # of available slots should be)
-        #num_slots = max(1, active_bidders-1) 
-        num_slots = max(1, n-1) 
-       
+                    current_bids[i] = (a.id, 0)
+
+        if sparse:
+            bids = GSP.top_bids(current_bids, num_slots + 1)
+            bid_summary = BidSummary.of_others(current_bids, bids)
+        else:
+            bids = list(current_bids)
+            bid_summary = None
+
         ##   1b.  Calculate clicks/slot
-        slot_clicks[t] = [iround(top_slot_clicks * pow(config.dropoff, i))
-                          for i in range(num_slots)]
-                          
+        slot_clicks = [iround(top_slot_clicks * pow(config.dropoff, i))
+                       for i in range(num_slots)]
+        bidding_done = default_timer()
+        phase_time['agents'] += bidding_done - start
+
         ##  2. Run mechanism and allocate slots
-        (slot_occupants[t], per_click_payments[t]) = (
-            mechanism.compute(slot_clicks[t],
-                              reserve, bids[t]))
+        # Ranked once, for the live mechanism and any shadows
+        ranked = GSP.rank(reserve, bids)
+        (slot_occupants, per_click_payments) = (
+            mechanism.price(slot_clicks,
+                            reserve, ranked))
+        for (shadow_mechanism, shadow) in shadows:
+            (occupants, per_click) = shadow_mechanism.price(
+                slot_clicks, reserve, ranked)
+            payments = [c * p for (c, p) in zip(slot_clicks, per_click)]
+            shadow.rounds[t] = Round(bids, occupants, slot_clicks, per_click,
+                                     payments, bid_summary)
+            for (agent_id, c, p, payment) in zip(occupants, slot_clicks,
+                                                 per_click, payments):
+                if agent_id is not None:
+                    shadow.agents_spent[agent_id] += payment
+                    shadow.agents_utility[agent_id] += (
+                        c * (by_id[agent_id].value - p))
+            shadow.revenue += sum(payments)
+        metrics.mechanism_calls += 1 + len(shadows)
+        mechanism_done = default_timer()
+        phase_time['mechanism'] += mechanism_done - bidding_done
         
         ##  3. Define payments
-        slot_payments[t] = map(lambda (x,y): x*y,
-                               zip(slot_clicks[t], per_click_payments[t]))
-                               
-        ##  4.  Save utility (misnamed as values)
-        values[t] = dict(zip(agent_ids, zeros))
-        
-        def agent_value(agent_id, clicks, payment):
+        slot_payments = map(lambda (x,y): x*y,
+                            zip(slot_clicks, per_click_payments))
+        rounds[t] = Round(bids, slot_occupants, slot_clicks,
+                          per_click_payments, slot_payments, bid_summary)
+
+        ##  4.  Save utility
+        for (agent_id, c, p, payment) in zip(slot_occupants,
+                                             slot_clicks,
+                                             per_click_payments,
+                                             slot_payments):
             if agent_id is not None:
-                values[t][agent_id] = by_id[agent_id].value * clicks - payment
-            return None
+                spent[agent_id] += payment
+                utility[agent_id] += c * (by_id[agent_id].value - p)
+        history.revenue += sum(slot_payments)
         
-        map(agent_value, slot_occupants[t], slot_clicks[t], slot_payments[t])
-        
-        ## Debugging. Set to True to see what's happening.
-        log_console = False
-        if log_console:
-            logging.info("\t=== Round %d ===" % t)
-            logging.info("\tnum_slots: %d" % num_slots)
-            logging.info("\tbids: %s" % bids[t])
-            logging.info("\tslot occupants: %s" % slot_occupants[t])
-            logging.info("\tslot_clicks: %s" % slot_clicks[t])
-            logging.info("\tper_click_payments: %s" % per_click_payments[t])
-            logging.info("\tslot_payments: %s" % slot_payments[t])
-            logging.info("\tUtility: %s" % values[t])
-            logging.info("\ttotals spent: %s" % [total_spent(a.id, t+1) for a in agents])
-            
-    
-    for t in range(0, config.num_rounds):
-        # Over 48 rounds, go from 80 to 20 and back to 80.  Mean 50.
-        # Makes sense when 48 rounds, to simulate a day
-        top_slot_clicks = iround(30*math.cos(math.pi*t/24) + 50)
+        ## Debugging: see --trace
+        if tracing and tracer.wants(t):
+            tracer.round(t, bids, slot_occupants, slot_clicks,
+                         per_click_payments, slot_payments,
+                         [by_id[agent_id].value * c - payment
+                          for (agent_id, c, payment) in zip(
+                              slot_occupants, slot_clicks, slot_payments)],
+                         spent)
+        phase_time['accounting'] += default_timer() - mechanism_done
 
-        if t == config.num_rounds / 2 and config.mechanism == 'switch':
+    first = 0 if start is None else start.t
+    end = config.num_rounds if stop is None else stop
+    if start is not None:
+        random.setstate(start.rng_state)
+        if config.mechanism == 'switch' and first > config.num_rounds / 2:
             mechanism = VCG
-        ##   0.  Runs one round
-        run_round(top_slot_clicks, t)
-        for a in agents:
-            history.set_agent_spent(a.id, total_spent(a.id, t))
-    
+    try:
+        for t in range(first, end):
+            # Over 48 rounds, go from 80 to 20 and back to 80.  Mean 50.
+            # Makes sense when 48 rounds, to simulate a day
+            top_slot_clicks = iround(30*math.cos(math.pi*t/24) + 50)
+
+            if t == config.num_rounds / 2 and config.mechanism == 'switch':
+                mechanism = VCG
+            ##   0.  Runs one round
+            run_round(top_slot_clicks, t)
+            # After round t, agents see spend through (not including) round t
+            if t > 0:
+                previous = rounds[t-1]
+                for (agent_id, payment) in zip(previous.occupants,
+                                               previous.slot_payments):
+                    history.set_agent_spent(
+                        agent_id, history.agents_spent[agent_id] + payment)
+    finally:
+        # Don't leave bidding services running if anything went wrong
+        if own_agents:
+            for (_, a) in remote:
+                a.close()
+
+    if stop is not None:
+        return Snapshot(stop, agents, rounds, spent, history.agents_spent,
+                        history.agents_utility, history.revenue,
+                        current_bids, broke)
+
     for a in agents:
-        history.set_agent_spent(a.id, total_spent(a.id, config.num_rounds))
-    
+        history.set_agent_spent(a.id, spent[a.id])
+
+    metrics.sims = 1
+    metrics.rounds = end - first
+    metrics.history_materializations = history.materializations
+    metrics.peak_history = len(rounds.keys())
     return history
 
+def _continue_variant(args):
+    """Pool worker: args is (config, snapshot).  Returns the continued
+    simulation's Stats totals.  The caller's random state is restored
+    afterwards, since without a pool this runs in the caller's process."""
+    (config, snapshot) = args
+    state = random.getstate()
+    try:
+        values = dict(enumerate(config.agent_values))
+        return Stats(sim(config, start=snapshot), values).totals(len(values))
+    finally:
+        random.setstate(state)
+
+
+def sim_variants(config, t, variants, processes=1):
+    """
+    Simulates config up to round t once, then the rest of the day once
+    for each variant: a dict of config settings that change from round t
+    on, e.g. {'reserve': 50}.  The variants share the first t rounds,
+    random stream included.  Returns each variant's Stats totals,
+    (utilities, spend, revenue), for the whole day.  With processes > 1
+    the continuations run in parallel.
+    """
+    snapshot = sim(config, stop=t)
+    configs = []
+    for changes in variants:
+        c = copy.copy(config)
+        for (k, v) in changes.items():
+            setattr(c, k, v)
+        if processes > 1:
+            # Timing and tracing stay in this process
+            c.bid_timer = c.tracer = None
+        configs.append(c)
+    tasks = [(c, snapshot) for c in configs]
+    if processes > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            return pool.map(_continue_variant, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    return map(_continue_variant, tasks)
+
+
+def sim_days(config, workspace=None):
+    """
+    Runs config.days days (one if it isn't set) with the same agents, so
+    they carry whatever they learn from one day to the next.  Budgets
+    reset every day and the click curve starts over.  Yields each day's
+    History as the day ends, so only one day is held at a time.  With a
+    Workspace, its agents and round store are reused.  With
+    config.markets over one, each day is a multi-market day (see
+    markets.py).
+    """
+    if workspace is None:
+        agents = init_agents(config)
+    else:
+        agents = workspace.agents_for(config)
+    window = getattr(config, 'history_window', None)
+    try:
+        for d in range(getattr(config, 'days', 1)):
+            if getattr(config, 'markets', 1) > 1:
+                import markets
+                yield markets.sim_markets(config, agents)
+                continue
+            store = workspace and workspace.round_store(window)
+            yield sim(config, agents, store=store)
+    finally:
+        for a in agents:
+            if is_remote(a):
+                a.close()
+
+
+def write_day(f, i, j, day, history, values):
+    """Append one day's totals to the day log f as a CSV line: iteration,
+    assignment, day, revenue, then each agent's utility and spend"""
+    (utility, spend, revenue) = Stats(history, values).totals(len(values))
+    f.write(','.join(map(str, [i, j, day, revenue] + utility + spend)))
+    f.write('\n')
+
+
 class Params:
     def __init__(self):
         self._init_keys = set(self.__dict__.keys())
@@ -183,9 +523,13 @@ class Params:
 
 def load_modules(agent_classes):
     """Each agent class must be in module class_name.lower().
+    Names of the form remote:ClassName run that class out of process.
     Returns a dictionary class_name->class"""
 
     def load(class_name):
+        if class_name.startswith('remote:'):
+            # Run in a bidserver.py subprocess
+            return (class_name, remote_class(class_name[len('remote:'):]))
         module_name = class_name.lower()  # by convention / fiat
         module = __import__(module_name)
         agent_class = module.__dict__[class_name]
@@ -241,16 +585,188 @@ def parse_agents(args):
             raise ValueError("Bad argument: %s\n" % c)
     return ans
 
-def main(args):
+def class_groups(class_names):
+    """Returns the agent ids grouped by class name, as a list of lists in
+    order of first appearance"""
+    groups = {}
+    order = []
+    for (id, name) in enumerate(class_names):
+        if name not in groups:
+            groups[name] = []
+            order.append(name)
+        groups[name].append(id)
+    return [groups[name] for name in order]
+
+def run_adaptive(options, agents_to_run):
+    """
+    Sample value draws until the 95% confidence intervals on average daily
+    revenue and on every agent's average utility are at most
+    options.ci_width cents wide, or until options.max_samples simulations
+    or options.time_budget seconds have been used.  Each sample is a
+    fresh draw of values, which are already in random order, so no
+    separate permutation sampling is needed.  Returns the revenue, utility
+    and spend RunningStats and why sampling stopped.
+    """
+    n = len(agents_to_run)
+    revenue = RunningStat()
+    utility = [RunningStat() for id in range(n)]
+    spend = [RunningStat() for id in range(n)]
+    tracked = [revenue] + utility
+
+    def converged():
+        # A handful of samples first, so early luck can't stop the run
+        return (revenue.n >= options.min_samples and
+                max(s.ci_halfwidth() for s in tracked) * 2 <=
+                options.ci_width)
+
+    start = time.time()
+    reason = "sample budget"
+    while revenue.n < options.max_samples:
+        if converged():
+            reason = "target width"
+            break
+        if (options.time_budget is not None and
+            time.time() - start > options.time_budget):
+            reason = "time budget"
+            break
+        options.agent_values = get_utils(n, options)
+        values = dict(zip(range(n), options.agent_values))
+        history = sim(options)
+        (utils, _, rev) = Stats(history, values).totals(n)
+        for id in range(n):
+            utility[id].add(utils[id])
+            spend[id].add(history.agents_spent[id])
+        revenue.add(rev)
+
+    logging.info("%s\t\t%s\t\t%s" % ("#" * 15, "RESULTS", "#" * 15))
+    logging.info("Stopped after %d samples (%s)" % (revenue.n, reason))
+    logging.info("")
+    for a in range(n):
+        logging.info("Stats for Agent %d, %s" % (a, agents_to_run[a]))
+        logging.info("Average spend $%.2f +/- %.2f (daily)" % (
+            0.01 * spend[a].mean, 0.01 * spend[a].ci_halfwidth()))
+        logging.info("Average  utility  $%.2f +/- %.2f (daily)" % (
+            0.01 * utility[a].mean, 0.01 * utility[a].ci_halfwidth()))
+        logging.info("-" * 40)
+        logging.info("\n")
+    logging.warning("Average daily revenue: $%.2f +/- %.2f (95%% CI, %d samples)"
+                    % (0.01 * revenue.mean, 0.01 * revenue.ci_halfwidth(),
+                       revenue.n))
+    return (revenue, utility, spend, reason)
+
+def run_paired(options, agents_to_run):
+    """
+    Run every (mechanism, reserve) variant on the same scenarios: the
+    same value draws and permutations, and the same random stream for
+    tie-breaking and agents within each simulation.  Reports each
+    variant's average revenue and its paired difference from the first
+    variant.  With common random numbers the differences have far less
+    variance than comparing two independent runs.
+
+    With options.fork_at set, the variants only differ from that round
+    on: the rounds before it are run once, under the first variant, and
+    shared (see sim_variants).
+
+    With options.scenario_set, the value draws, permutations and seeds
+    come from the set instead.
+    """
+    n = len(agents_to_run)
+    mechs = (options.compare or options.mechanism).lower().split(',')
+    reserves = [options.reserve]
+    if options.compare_reserves:
+        reserves = [int(r) for r in options.compare_reserves.split(',')]
+    variants = [(m, r) for m in mechs for r in reserves]
+
+    # Scenarios come from their own stream so that the variants' use of
+    # the global one can't shift them.
+    stream = random.Random(options.seed)
+    scenario_set = getattr(options, 'scenario_set', None)
+    approx = math.factorial(n) > options.max_perms
+    fork_at = getattr(options, 'fork_at', None)
+
+    revenue = [RunningStat() for v in variants]
+    utility = [[RunningStat() for id in range(n)] for v in variants]
+    rev_diff = [RunningStat() for v in variants]
+    util_diff = [[RunningStat() for id in range(n)] for v in variants]
+
+    for i in range(options.iters):
+        if scenario_set is not None:
+            perms = [vals for (vals, _) in scenario_set.assignments(i)]
+        else:
+            values = [stream.randint(options.min_val, options.max_val)
+                      for id in range(n)]
+            if approx:
+                perms = []
+                for p in range(options.max_perms):
+                    perm = values[:]
+                    stream.shuffle(perm)
+                    perms.append(perm)
+            else:
+                perms = itertools.permutations(values)
+
+        for (j, vals) in enumerate(perms):
+            options.agent_values = list(vals)
+            value_of = dict(zip(range(n), vals))
+            if scenario_set is not None:
+                seed = sim_seed(scenario_set.run_seed, i, j)
+            else:
+                seed = stream.getrandbits(32)
+            results = []
+            if fork_at is not None:
+                (options.mechanism, options.reserve) = variants[0]
+                random.seed(seed)
+                for (utils, _, rev) in sim_variants(
+                        options, fork_at,
+                        [{'mechanism': m, 'reserve': r} for (m, r) in variants],
+                        getattr(options, 'processes', 1)):
+                    results.append((rev, utils))
+            else:
+                for (mech, reserve) in variants:
+                    options.mechanism = mech
+                    options.reserve = reserve
+                    random.seed(seed)
+                    (utils, _, rev) = Stats(sim(options), value_of).totals(n)
+                    results.append((rev, utils))
+            (base_rev, base_utils) = results[0]
+            for (v, (rev, utils)) in enumerate(results):
+                revenue[v].add(rev)
+                rev_diff[v].add(rev - base_rev)
+                for id in range(n):
+                    utility[v][id].add(utils[id])
+                    util_diff[v][id].add(utils[id] - base_utils[id])
 
+    def name(v):
+        return "%s, reserve %d" % variants[v]
+
+    logging.info("%s\t\t%s\t\t%s" % ("#" * 15, "RESULTS", "#" * 15))
+    logging.info("%d paired samples" % revenue[0].n)
+    logging.info("")
+    for v in range(len(variants)):
+        logging.info("%s: average daily revenue $%.2f +/- %.2f" % (
+            name(v), 0.01 * revenue[v].mean, 0.01 * revenue[v].ci_halfwidth()))
+        for id in range(n):
+            logging.info("  Agent %d, %s: utility $%.2f" % (
+                id, agents_to_run[id], 0.01 * utility[v][id].mean))
+    for v in range(1, len(variants)):
+        unpaired = math.sqrt(revenue[0].variance() + revenue[v].variance())
+        logging.info("")
+        logging.info("%s minus %s:" % (name(v), name(0)))
+        logging.warning("  revenue $%.2f +/- %.2f (stddev $%.2f paired, "
+                        "$%.2f unpaired)" % (
+                            0.01 * rev_diff[v].mean,
+                            0.01 * rev_diff[v].ci_halfwidth(),
+                            0.01 * rev_diff[v].stddev(), 0.01 * unpaired))
+        for id in range(n):
+            logging.info("  Agent %d utility $%.2f +/- %.2f (variance %.2f)" % (
+                id, 0.01 * util_diff[v][id].mean,
+                0.01 * util_diff[v][id].ci_halfwidth(),
+                0.0001 * util_diff[v][id].variance()))
+    return (variants, revenue, rev_diff)
+
+def build_parser():
     usage_msg = "Usage:  %prog [options] PeerClass1[,cnt] PeerClass2[,cnt2] ..."
     parser = OptionParser(usage=usage_msg)
 
-    def usage(msg):
-        print "Error: %s\n" % msg
-        parser.print_help()
-        sys.exit()
-    
     parser.add_option("--loglevel",
                       dest="loglevel", default="info",
                       help="Set the logging level: 'debug' or 'info'")
@@ -275,6 +791,10 @@ def main(args):
                       dest="budget", default=500000, type="int",
                       help="Total budget, in cents")
     
+    parser.add_option("--dropoff",
+                      dest="dropoff", default=0.75, type="float",
+                      help="Ratio of clicks in each slot to the slot above it")
+
     parser.add_option("--reserve",
                       dest="reserve", default=0, type="int",
                       help="Reserve price, in cents")
@@ -287,94 +807,668 @@ def main(args):
                       dest="iters", default=1, type="int",
                       help="Number of different value draws to sample. Set to 1 for debugging.")
 
-    parser.add_option("--seed",
-                      dest="seed", default=None, type="int",
-                      help="seed for random numbers")
+    parser.add_option("--no-fast-path",
+                      dest="static_fast_path", default=True,
+                      action="store_false",
+                      help="Call bid() every round even for history-independent agents")
 
+    parser.add_option("--time-bids",
+                      dest="time_bids", default=False, action="store_true",
+                      help="Measure time spent in each agent's bid() and print a summary")
 
-    (options, args) = parser.parse_args()
+    parser.add_option("--bid-time-limit",
+                      dest="bid_time_limit", default=None, type="float",
+                      help="Per-call bid() time limit, in ms.  Slower calls keep the previous bid.  Implies --time-bids")
 
-    # leftover args are class names:
-    # e.g. "Truthful BBAgent CleverBidder Fred"
+    parser.add_option("--num-slots",
+                      dest="num_slots", default=None, type="int",
+                      help="Number of ad slots (default: number of agents - 1)")
 
-    if len(args) == 0:
-        # default
-        agents_to_run = ['Truthful', 'Truthful', 'Truthful']
-    else:
-        agents_to_run = parse_agents(args)
+    parser.add_option("--sparse-history",
+                      dest="sparse_history", default=False, action="store_true",
+                      help="Large-population mode: only keep the bids of the winners and first loser each round")
 
-    configure_logging(options.loglevel)
+    parser.add_option("--bid-deadline",
+                      dest="bid_deadline", default=None, type="float",
+                      help="Seconds per round remote: agents have to answer; late bids keep the previous bid")
 
-    if options.seed != None:
-        random.seed(options.seed)
+    parser.add_option("--days",
+                      dest="days", default=1, type="int",
+                      help="Days to run each simulation for, with the same agents; budgets reset and the click curve repeats each day")
 
-    # Add some more config options
+    parser.add_option("--day-log",
+                      dest="day_log", default=None,
+                      help="Append each simulated day's revenue, utilities and spend to this CSV file as the day ends")
+
+    parser.add_option("--metrics",
+                      dest="metrics", default=False, action="store_true",
+                      help="Print the engine's work counters and phase times at the end of the run")
+
+    parser.add_option("--metrics-json",
+                      dest="metrics_json", default=None,
+                      help="Write the engine's work counters and phase times to this JSON file")
+
+    parser.add_option("--make-scenarios",
+                      dest="make_scenarios", default=None, metavar="FILE",
+                      help="Write the run's value draws and permutations to this scenario set file, and stop")
+
+    parser.add_option("--scenarios",
+                      dest="scenarios", default=None, metavar="FILE",
+                      help="Run the value draws and permutations of this scenario set file (see --make-scenarios)")
+
+    parser.add_option("--markets",
+                      dest="markets", default=1, type="int",
+                      help="Keyword markets each agent bids in every round, all paid for out of one budget")
+
+    parser.add_option("--market-mechanisms",
+                      dest="market_mechanisms", default=None,
+                      help="Mechanisms of the markets, used in turn, e.g. 'gsp,vcg' (default: --mech)")
+
+    parser.add_option("--history-window",
+                      dest="history_window", default=None, type="int",
+                      help="Only keep the last K rounds of each simulation's history, for very long runs")
+
+    parser.add_option("--bid-log",
+                      dest="bid_log", default=None,
+                      help="Write every simulated round's bids and clicks to this file, for replay.py")
+
+    parser.add_option("--all-perms",
+                      dest="dedup_perms", default=True, action="store_false",
+                      help="Run every value permutation, even ones that only swap values between agents of the same class")
+
+    parser.add_option("--ci-width",
+                      dest="ci_width", default=None, type="float",
+                      help="Adaptive mode: sample until the 95% confidence intervals on revenue and utilities are this narrow, in cents")
+
+    parser.add_option("--min-samples",
+                      dest="min_samples", default=10, type="int",
+                      help="Adaptive mode: minimum number of samples")
+
+    parser.add_option("--max-samples",
+                      dest="max_samples", default=100000, type="int",
+                      help="Adaptive mode: maximum number of samples")
+
+    parser.add_option("--time-budget",
+                      dest="time_budget", default=None, type="float",
+                      help="Adaptive mode: stop sampling after this many seconds")
+
+    parser.add_option("--compare",
+                      dest="compare", default=None,
+                      help="Paired comparison of mechanisms on common random numbers, e.g. 'gsp,vcg'")
+
+    parser.add_option("--compare-reserves",
+                      dest="compare_reserves", default=None,
+                      help="Paired comparison of reserve prices, e.g. '0,20,40'")
+
+    parser.add_option("--shadow",
+                      dest="shadow", default=None,
+                      help="Also price every round's bids with these mechanisms, e.g. 'vcg' or 'gsp,vcg', and report their revenue; the agents only see the live mechanism")
+
+    parser.add_option("--fork-at",
+                      dest="fork_at", default=None, type="int",
+                      help="In a paired comparison, only switch to each variant at this round; the rounds before it are simulated once and shared")
+
+    parser.add_option("--processes",
+                      dest="processes", default=1, type="int",
+                      help="Processes to run the --fork-at variants in")
+
+    parser.add_option("--checkpoint",
+                      dest="checkpoint", default=None,
+                      help="Periodically save the run's progress to this file")
+
+    parser.add_option("--checkpoint-interval",
+                      dest="checkpoint_interval", default=60, type="float",
+                      help="Seconds between checkpoints")
+
+    parser.add_option("--resume",
+                      dest="resume", default=False, action="store_true",
+                      help="Continue the run saved in the --checkpoint file")
+
+    parser.add_option("--listen",
+                      dest="listen", default=None,
+                      help="Coordinate the run across workers (cluster.py HOST:PORT) connecting to this HOST:PORT")
+
+    parser.add_option("--task-size",
+                      dest="task_size", default=10, type="int",
+                      help="Value assignments per task handed to a worker")
+
+    parser.add_option("--task-timeout",
+                      dest="task_timeout", default=600, type="float",
+                      help="Seconds before a worker's task is handed to another worker")
+
+    parser.add_option("--worker-wait",
+                      dest="worker_wait", default=300, type="float",
+                      help="Give up if the coordinator has no workers for this many seconds")
+
+    parser.add_option("--trace",
+                      dest="trace", default=None,
+                      help="Write a record of every round's bids, allocation, payments, utilities and spend to this file")
+
+    parser.add_option("--trace-every-sim",
+                      dest="trace_every_sim", default=1, type="int",
+                      help="Only trace every Nth simulation")
+
+    parser.add_option("--trace-every-round",
+                      dest="trace_every_round", default=1, type="int",
+                      help="Only trace every Nth round of a traced simulation")
+
+    parser.add_option("--round-series",
+                      dest="round_series", default=None,
+                      help="Write per-round means and stddevs of revenue, slot prices and spend across all simulations to this CSV file")
+
+    parser.add_option("--seed",
+                      dest="seed", default=None, type="int",
+                      help="seed for random numbers")
+
+    return parser
+
+def configure(options, agents_to_run):
+    """Add the config options derived from the command line ones"""
     options.agent_class_names = agents_to_run
     options.agent_classes = load_modules(options.agent_class_names)
-    options.dropoff = 0.75
+    if options.time_bids or options.bid_time_limit is not None:
+        limit = options.bid_time_limit
+        options.bid_timer = BidTimer(None if limit is None else limit / 1000.0)
+    else:
+        options.bid_timer = None
+    if options.trace:
+        options.tracer = simtrace.open_tracer(
+            options.trace, options.trace_every_sim, options.trace_every_round,
+            keep=options.resume)
+    else:
+        options.tracer = None
+    options.shadow_mechanisms = (options.shadow.lower().split(',')
+                                 if options.shadow else [])
 
-    logging.info("Starting simulation...")
-    n = len(agents_to_run)
+class RunResults:
+    """
+    Streaming statistics over a set of simulations: each agent's daily
+    utility and spend, the daily revenue, and the average revenue of each
+    iteration (value draw).  Samples are weighted by the number of value
+    permutations they stand for.
+    """
+    def __init__(self, n, rounds=None, shadows=()):
+        self.utility = [RunningStat() for id in range(n)]
+        self.spend = [RunningStat() for id in range(n)]
+        self.revenue = RunningStat()
+        # Shadow mechanism name -> daily revenue it would have made
+        self.shadow_revenue = dict((name, RunningStat()) for name in shadows)
+        self.iteration_revenue = RunningStat()
+        # Optional timeseries.RoundSeries
+        self.rounds = rounds
+        # Engine work over the simulations (a metrics.Metrics)
+        self.metrics = Metrics()
 
-    totals = dict((id, 0) for id in range(n))
-    total_revenues = []
+    def sharing(self):
+        """For each agent, the first agent whose stats it shares (agents
+        of a class share them when only distinct assignments are run)"""
+        return [[id for (id, t) in enumerate(stats) if t is s][0]
+                for stats in [self.utility, self.spend] for s in stats]
 
-    approx = math.factorial(n) > options.max_perms
+    def merge(self, other):
+        assert self.sharing() == other.sharing(), \
+            "can't merge results that share stats between different agents"
+        assert (self.rounds is None) == (other.rounds is None), \
+            "can't merge results with and without round series"
+        # Merge each shared stat only once
+        seen = set()
+        for (mine, theirs) in zip(self.utility + self.spend,
+                                  other.utility + other.spend):
+            if id(mine) not in seen:
+                seen.add(id(mine))
+                mine.merge(theirs)
+        self.revenue.merge(other.revenue)
+        self.iteration_revenue.merge(other.iteration_revenue)
+        assert sorted(self.shadow_revenue) == sorted(other.shadow_revenue), \
+            "can't merge results with different shadow mechanisms"
+        for (name, stat) in self.shadow_revenue.items():
+            stat.merge(other.shadow_revenue[name])
+        if self.rounds is not None:
+            self.rounds.merge(other.rounds)
+        self.metrics.merge(other.metrics)
+        return self
+
+
+def plan_permutations(options, agents_to_run):
+    """
+    Decide how to cover the permutations of each value draw.  Returns
+    (groups, share, approx, num_perms): the agents' class groups, whether
+    to run only the distinct value-to-class assignments, each weighted by
+    how many permutations it stands for, whether to sample
+    options.max_perms permutations instead because there are more than
+    that to run, and the total weight of the permutations run per draw.
+    """
+    n = len(agents_to_run)
+    # Agents of the same class are interchangeable, so permutations that
+    # only swap values between them give the same outcomes up to
+    # relabeling.  Run each distinct assignment of values to classes once,
+    # weighted by how many permutations it stands for, and split each
+    # class's results evenly between its agents.
+    groups = class_groups(agents_to_run)
+    dedup = options.dedup_perms and len(groups) < n
+    if dedup:
+        distinct = math.factorial(n)
+        for g in groups:
+            distinct /= math.factorial(len(g))
+    else:
+        distinct = math.factorial(n)
+
+    approx = distinct > options.max_perms
     if approx:
         num_perms = options.max_perms
         logging.warning(
             "Running approximation: taking %d samples of value permutations"
             % options.max_perms)
     else:
+        # Weights of the distinct assignments add up to n!
         num_perms = math.factorial(n)
+        if dedup:
+            logging.info("Running %d distinct value assignments "
+                         "instead of %d permutations" % (distinct, num_perms))
+    return (groups, dedup and not approx, approx, num_perms)
+
+
+def empty_results(options, agents_to_run, groups, share):
+    """A RunResults to accumulate run_permutations' simulations in"""
+    n = len(agents_to_run)
+    results = RunResults(n, shadows=options.shadow_mechanisms)
+    if share:
+        # Every agent in a class has the class's distribution, so only
+        # keep one per class
+        for g in groups:
+            for id in g:
+                results.utility[id] = results.utility[g[0]]
+                results.spend[id] = results.spend[g[0]]
+    if options.round_series:
+        if share:
+            results.rounds = RoundSeries(groups, [agents_to_run[g[0]]
+                                                  for g in groups])
+        else:
+            results.rounds = RoundSeries([[id] for id in range(n)])
+    return results
+
+
+def record(results, history, values, weight, groups, share):
+    """Add one simulation, standing for weight permutations, to results.
+    Returns its revenue."""
+    n = len(values)
+    stats = Stats(history, values)
+    # Print stats in console?
+    # logging.info(stats)
+
+    (utils, _, rev) = stats.totals(n)
+    if share:
+        # Over all the permutations this stands for, each agent in a class
+        # ends up with each of the class's outcomes equally often.  weight
+        # is a multiple of len(g)! (see util.distinct_assignments), so that
+        # is weight / len(g) times each.
+        for g in groups:
+            w = weight // len(g)
+            for id in g:
+                results.utility[g[0]].add(utils[id], w)
+                results.spend[g[0]].add(history.agents_spent[id], w)
+    else:
+        for id in range(n):
+            results.utility[id].add(utils[id])
+            results.spend[id].add(history.agents_spent[id])
+    if results.rounds is not None:
+        results.rounds.add(history, weight)
+    results.metrics.merge(history.metrics)
+    results.revenue.add(rev, weight)
+    for (name, shadow) in history.shadows.items():
+        (_, _, shadow_rev) = Stats(shadow, values).totals(n)
+        results.shadow_revenue[name].add(shadow_rev, weight)
+    return rev
+
+
+def sim_seed(run_seed, i, j):
+    """
+    Seed for the j-th simulation of iteration i (j = -1 for the
+    iteration's value draw).  Each simulation's random numbers depend only
+    on its place in the run, not on what ran before it, so a run can be
+    resumed or split across machines (see cluster.py) without changing
+    its results.
+    """
+    h = hashlib.sha1('%d:%d:%d' % (run_seed, i, j)).hexdigest()
+    return int(h[:15], 16)
+
+
+def assignments(options, n, plan, run_seed, i):
+    """Returns iteration i's value draw and an iterable of the
+    (values, weight) assignments to simulate for it.  plan is what
+    plan_permutations returned.  With options.scenario_set, they are
+    read from the set."""
+    scenario_set = getattr(options, 'scenario_set', None)
+    if scenario_set is not None:
+        return (scenario_set.draw(i), scenario_set.assignments(i))
+    (groups, share, approx, num_perms) = plan
+    rng = random.Random(sim_seed(run_seed, i, -1))
+    draw = [rng.randint(options.min_val, options.max_val) for id in range(n)]
+    ## Create permutations (permutes the fom values, and assigns them to agents)
+    if approx:
+        perms = [(rng.sample(draw, n), 1) for k in range(options.max_perms)]
+    elif share:
+        perms = distinct_assignments(draw, groups)
+    else:
+        perms = ((p, 1) for p in itertools.permutations(draw))
+    return (draw, perms)
 
-    av_value=range(0,n)
-    total_spent = [0 for i in range(n)]
+
+def run_plan(options, agents_to_run):
+    """(plan, run seed) for a permutation run: those of
+    options.scenario_set if there is one, otherwise a new plan (see
+    plan_permutations) and seed"""
+    scenario_set = getattr(options, 'scenario_set', None)
+    if scenario_set is not None:
+        return (scenario_set.plan, scenario_set.run_seed)
+    return (plan_permutations(options, agents_to_run), random.getrandbits(64))
+
+
+def make_scenarios(options, agents_to_run, path):
+    """Write the value draws and assignments run_permutations would run
+    to a scenario set at path (see scenarios.py)"""
+    n = len(agents_to_run)
+    (plan, run_seed) = run_plan(options, agents_to_run)
+    scenarios.write(path, n, options.iters, plan, run_seed,
+                    (assignments(options, n, plan, run_seed, i)
+                     for i in range(options.iters)))
+
+
+def run_permutations(options, agents_to_run):
+    """
+    Run the simulation over options.iters value draws and their
+    permutations.  Returns a RunResults.
+    """
+    n = len(agents_to_run)
+    (plan, run_seed) = run_plan(options, agents_to_run)
+    (groups, share, approx, num_perms) = plan
+    results = empty_results(options, agents_to_run, groups, share)
+
+    # Where a resumed run picks up: the iteration, how many of its
+    # permutations are done and the revenue they made
+    first = 0
+    resumed = None
+    key = checkpoint.fingerprint(options, agents_to_run)
+    if options.resume:
+        state = checkpoint.load(options.checkpoint, key)
+        results = state['results']
+        if options.bid_timer is not None:
+            options.bid_timer = state['bid_timer']
+        first = state['iteration']
+        resumed = state['position']
+        run_seed = state['run_seed']
+        if options.tracer is not None:
+            options.tracer.resume(state.get('trace_position', (0, 0)))
+        logging.info("Resuming from %s at iteration %d" % (
+            options.checkpoint, first))
+    last_save = time.time()
+
+    def open_log(path, size_key):
+        if not path:
+            return None
+        if not options.resume:
+            return open(path, 'w')
+        # Drop whatever was logged after the checkpoint
+        f = open(path, 'r+')
+        f.truncate(state.get(size_key, 0))
+        f.seek(0, 2)
+        return f
+
+    bid_log = open_log(options.bid_log, 'bid_log_size')
+    day_log = open_log(options.day_log, 'day_log_size')
+    if day_log is not None and day_log.tell() == 0:
+        day_log.write(','.join(['iteration', 'assignment', 'day', 'revenue'] +
+                               ['utility_%d' % id for id in range(n)] +
+                               ['spend_%d' % id for id in range(n)]) + '\n')
+
+    def save(i, position):
+        saved = {'fingerprint': key, 'iteration': i, 'position': position,
+                 'run_seed': run_seed, 'results': results,
+                 'bid_timer': options.bid_timer}
+        for (name, f) in [('bid_log_size', bid_log),
+                          ('day_log_size', day_log)]:
+            if f is not None:
+                f.flush()
+                saved[name] = f.tell()
+        if options.tracer is not None:
+            saved['trace_position'] = options.tracer.position()
+        checkpoint.save(options.checkpoint, saved)
+
+    # Agents and round storage, reused by every simulation
+    workspace = Workspace()
 
     ##  iters = no. of samples to take
-    for i in range(options.iters):
-        values = get_utils(n, options)
-        logging.info("==== Iteration %d / %d.  Values %s ====" % (i, options.iters, values))
-        ## Create permutations (permutes the fom values, and assigns them to agents)
-        if approx:
-            perms = [shuffled(values) for i in range(options.max_perms)]
+    for i in range(first, options.iters):
+        (draw, perms) = assignments(options, n, plan, run_seed, i)
+        if resumed is None:
+            done = 0
+            total_rev = 0
         else:
-            perms = itertools.permutations(values)
+            (done, total_rev) = resumed
+            resumed = None
+        logging.info("==== Iteration %d / %d.  Values %s ====" % (i, options.iters, draw))
 
-        total_rev = 0
-        ## Iterate over permutations
-        for vals in perms:
+        ## Iterate over permutations, skipping any done before a restart
+        for (vals, weight) in itertools.islice(perms, done, None):
+            random.seed(sim_seed(run_seed, i, done))
             options.agent_values = list(vals)
             values = dict(zip(range(n), list(vals)))
-            ##   Runs simulation  ###
-            history = sim(options)
+            ##   Runs simulation, a day at a time  ###
+            rev = 0
+            for (day, history) in enumerate(sim_days(options, workspace)):
+                if bid_log is not None:
+                    replay.write_history(history, values, bid_log, weight)
+                if day_log is not None:
+                    write_day(day_log, i, done, day, history, values)
+                rev += record(results, history, values, weight, groups, share)
             ###  simulation ends.
-            stats = Stats(history, values)
-            # Print stats in console?
-            # logging.info(stats)
-            
-            for id in range(n):
-                totals[id] += stats.total_utility(id)
-                total_spent[id] += history.agents_spent[id]
-            total_rev += stats.total_revenue()
-        total_revenues.append(total_rev / float(num_perms))
+            total_rev += weight * rev / options.days
+            done += 1
+            if (options.checkpoint and
+                time.time() - last_save >= options.checkpoint_interval):
+                save(i, (done, total_rev))
+                last_save = time.time()
+        results.iteration_revenue.add(total_rev / float(num_perms))
+
+    if options.checkpoint:
+        save(options.iters, None)
+    for f in [bid_log, day_log]:
+        if f is not None:
+            f.close()
+
+    return results
+
 
+def describe(stat):
+    """One-line summary of the distribution of a RunningStat in cents"""
+    return ("stddev $%.2f, min $%.2f, 5%% $%.2f, median $%.2f, "
+            "95%% $%.2f, max $%.2f" % tuple(
+                0.01 * x for x in [stat.stddev(), stat.min, stat.quantile(0.05),
+                                   stat.quantile(0.5), stat.quantile(0.95),
+                                   stat.max]))
+
+def report(options, agents_to_run, results):
+    """Log the results of run_permutations and write the round series"""
+    n = len(agents_to_run)
     ## total_spent = total amount of money spent by agents, for all iterations, all permutations, all rounds
     
     # Averages are over all the value permutations considered    
-    N = float(num_perms) * options.iters
     logging.info("%s\t\t%s\t\t%s" % ("#" * 15, "RESULTS", "#" * 15))
     logging.info("")
     for a in range(n):
         logging.info("Stats for Agent %d, %s" % (a, agents_to_run[a]) )
-        logging.info("Average spend $%.2f (daily)" % (0.01 *total_spent[a]/N)  )   
-        logging.info("Average  utility  $%.2f (daily)" % (0.01 * totals[a]/N))
+        logging.info("Average spend $%.2f (daily)" % (0.01 * results.spend[a].mean))
+        logging.info("Average  utility  $%.2f (daily)" % (0.01 * results.utility[a].mean))
+        logging.info("  utility %s" % describe(results.utility[a]))
         logging.info("-" * 40)
         logging.info("\n")
-    m = mean(total_revenues)
-    std = stddev(total_revenues)
+    logging.info("Daily revenue %s" % describe(results.revenue))
+    for name in sorted(results.shadow_revenue):
+        stat = results.shadow_revenue[name]
+        logging.info("Shadow %s: average daily revenue $%.2f, %s" % (
+            name, 0.01 * stat.mean, describe(stat)))
+    m = results.iteration_revenue.mean
+    std = results.iteration_revenue.pstddev()
     logging.warning("Average daily revenue (stddev): $%.2f ($%.2f)" % (0.01 * m, 0.01*std))
 
+    if results.rounds is not None:
+        with open(options.round_series, 'w') as f:
+            results.rounds.write_csv(f)
+    if options.metrics:
+        logging.info("")
+        results.metrics.log_summary()
+    if options.metrics_json:
+        with open(options.metrics_json, 'w') as f:
+            results.metrics.write_json(f)
+
+
+def check_options(options, agents_to_run):
+    """
+    Raises ValueError, saying why, if options (after configure) ask for
+    something that can't be run with agents_to_run.  Opens
+    options.scenarios as options.scenario_set.
+    """
+    if options.sparse_history:
+        dense = dense_history_classes(options.agent_classes.values())
+        if dense:
+            raise ValueError("Agents that need every bid in the history "
+                             "can't run with --sparse-history: %s" %
+                             ", ".join(dense))
+    if options.history_window is not None:
+        if options.history_window < 1:
+            raise ValueError("--history-window must be at least 1")
+        if options.bid_log or options.round_series:
+            raise ValueError("--bid-log and --round-series need every "
+                             "round's history; they can't be used with "
+                             "--history-window")
+    if options.days < 1:
+        raise ValueError("--days must be at least 1")
+    if options.days > 1 and (options.ci_width is not None or
+                             options.compare or options.compare_reserves):
+        raise ValueError("--days only works with plain permutation runs")
+    if (options.metrics or options.metrics_json) and (
+            options.ci_width is not None or options.compare or
+            options.compare_reserves):
+        raise ValueError("--metrics and --metrics-json only work with "
+                         "plain permutation runs")
+    unknown = set(options.shadow_mechanisms) - set(replay.MECHANISMS)
+    if unknown:
+        raise ValueError("Unknown shadow mechanisms: %s" %
+                         ", ".join(sorted(unknown)))
+    if options.shadow and (options.fork_at is not None or
+                           options.ci_width is not None or
+                           options.compare or options.compare_reserves):
+        raise ValueError("--shadow only works with plain permutation runs")
+    if options.markets < 1:
+        raise ValueError("--markets must be at least 1")
+    if options.markets > 1:
+        names = (options.market_mechanisms or options.mechanism).lower()
+        unknown = set(names.split(',')) - set(replay.MECHANISMS)
+        if unknown:
+            raise ValueError("Unknown market mechanisms: %s" %
+                             ", ".join(sorted(unknown)))
+        if (options.sparse_history or options.shadow or options.trace or
+            options.round_series or options.ci_width is not None or
+            options.compare or options.compare_reserves or
+            any(n.startswith('remote:') for n in agents_to_run)):
+            raise ValueError("--markets doesn't work with --sparse-history, "
+                             "--shadow, --trace, --round-series, adaptive "
+                             "or paired runs, or remote agents")
+    if options.fork_at is not None and not (options.compare or
+                                            options.compare_reserves):
+        raise ValueError("--fork-at needs --compare or --compare-reserves")
+    if options.make_scenarios and (options.scenarios or
+                                   options.ci_width is not None or
+                                   options.compare or
+                                   options.compare_reserves):
+        raise ValueError("--make-scenarios makes the scenarios of a plain "
+                         "permutation run; it can't be combined with "
+                         "--scenarios, adaptive or paired runs")
+    if options.scenarios:
+        if options.ci_width is not None:
+            raise ValueError("--scenarios doesn't work with adaptive runs")
+        try:
+            options.scenario_set = scenarios.ScenarioSet(options.scenarios)
+        except IOError, e:
+            raise ValueError(str(e))
+        options.scenario_set.check(agents_to_run, options.iters)
+        (_, share, _, _) = options.scenario_set.plan
+        if share and (options.compare or options.compare_reserves):
+            raise ValueError("Paired runs need every permutation, not "
+                             "distinct assignments: make the scenario set "
+                             "with --all-perms")
+    if options.resume and not options.checkpoint:
+        raise ValueError("--resume needs a --checkpoint file")
+    if options.listen and (options.checkpoint or options.bid_log or
+                           options.day_log or options.time_bids or
+                           options.bid_time_limit is not None or
+                           options.trace):
+        raise ValueError("--listen can't be combined with --checkpoint, "
+                         "--bid-log, --day-log, --time-bids, "
+                         "--bid-time-limit or --trace")
+
+
+def main(args):
+    parser = build_parser()
+
+    def usage(msg):
+        print "Error: %s\n" % msg
+        parser.print_help()
+        sys.exit()
+
+    (options, args) = parser.parse_args()
+
+    # leftover args are class names:
+    # e.g. "Truthful BBAgent CleverBidder Fred"
+
+    if len(args) == 0:
+        # default
+        agents_to_run = ['Truthful', 'Truthful', 'Truthful']
+    else:
+        agents_to_run = parse_agents(args)
+
+    configure_logging(options.loglevel)
+
+    if options.seed != None:
+        random.seed(options.seed)
+
+    # Add some more config options
+    configure(options, agents_to_run)
+
+    try:
+        check_options(options, agents_to_run)
+    except ValueError, e:
+        usage(str(e))
+
+    if options.make_scenarios:
+        make_scenarios(options, agents_to_run, options.make_scenarios)
+        logging.info("Wrote %d iterations of scenarios to %s" % (
+            options.iters, options.make_scenarios))
+        return
+
+    logging.info("Starting simulation...")
+    if options.ci_width is not None:
+        run_adaptive(options, agents_to_run)
+    elif options.compare or options.compare_reserves:
+        run_paired(options, agents_to_run)
+    else:
+        if options.listen:
+            import cluster
+            server = cluster.listen(cluster.parse_address(options.listen))
+            try:
+                results = cluster.coordinate(options, agents_to_run, server)
+            finally:
+                server.close()
+        else:
+            results = run_permutations(options, agents_to_run)
+        report(options, agents_to_run, results)
+
+    if options.bid_timer is not None:
+        logging.info("")
+        options.bid_timer.log_summary()
+    if options.tracer is not None:
+        options.tracer.close()
+
 #print "config", config.budget
     
 
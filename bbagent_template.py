@@ -12,6 +12,12 @@ class BBAgent:
         self.value = value
         self.budget = budget
 
+    def reset(self, value, budget):
+        """Get ready for another simulation, as if newly made.  If you
+        keep any other state, reset it here too."""
+        self.value = value
+        self.budget = budget
+
     def initial_bid(self, reserve):
         return self.value / 2
 
@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+# Microbenchmarks for the auction kernels: GSP.compute, VCG.compute,
+# GSP.bid_range_for_slot and the balanced bidder's bid() (which goes
+# through slot_info).  Each runs over a grid of bidder counts, slot
+# counts, tie densities and reserves, on inputs generated from a fixed
+# seed so every run times the same work.
+#
+#   bench.py --save bench-baseline.json     record a baseline
+#   bench.py --check bench-baseline.json    compare against it; exits
+#                                           with status 1 on a slowdown
+#                                           beyond --threshold
+#
+# Timings are the best of --repeat measurements, each of enough calls to
+# take at least --min-time seconds, in seconds per call.  Every run also
+# times a fixed pure-Python reference workload, and --check compares each
+# kernel's time relative to it, so a baseline recorded on one machine
+# still means something on another.
+
+from optparse import OptionParser
+import json
+import logging
+import math
+import platform
+import random
+import re
+import sys
+from timeit import default_timer
+
+from gsp import GSP
+from vcg import VCG
+from history import History
+from seniorspringbb import seniorspringbb
+
+BIDDERS = [3, 10, 100, 1000, 10000]
+SLOTS = [2, 8]
+# Bids drawn from n distinct amounts, from n / 8 (so about 8 bidders
+# share each amount), or all the same
+TIES = ['none', 'some', 'all']
+# No reserve, or one that excludes about half the bidders
+RESERVES = ['zero', 'median']
+# Name of the reference workload's timing in the results
+REFERENCE = 'reference'
+REFERENCE_DATA = [random.Random(0).random() for i in range(1000)]
+# Benchmarks between timings of the reference
+REFERENCE_EVERY = 16
+
+
+def reference():
+    """The reference workload: plain interpreter work (a sort, a loop and
+    some tuple building), like the kernels' but independent of them"""
+    pairs = [(x, i) for (i, x) in enumerate(REFERENCE_DATA)]
+    total = 0.0
+    for (x, i) in sorted(pairs):
+        total += x * i
+    return total
+
+
+def make_bids(n, ties, rng):
+    if ties == 'none':
+        amounts = rng.sample(xrange(1, 100 * n), n)
+    elif ties == 'some':
+        amounts = [rng.randint(1, max(1, n / 8)) for i in range(n)]
+    else:
+        amounts = [50] * n
+    return zip(range(n), amounts)
+
+
+def make_case(n, slots, ties, reserve):
+    """Inputs for one grid point: (slot_clicks, reserve, bids)"""
+    rng = random.Random('%d/%d/%s/%s' % (n, slots, ties, reserve))
+    bids = make_bids(n, ties, rng)
+    clicks = [int(80 * 0.75 ** s) for s in range(slots)]
+    if reserve == 'median':
+        reserve = sorted(b for (_, b) in bids)[n / 2]
+    else:
+        reserve = 0
+    return (clicks, reserve, bids)
+
+
+def bb_history(clicks, bids):
+    """A one-round History in which bids were the bids"""
+    occupants = [a for (a, _) in sorted(bids, key=lambda (a, b): -b)]
+    occupants = occupants[:len(clicks)]
+    return History({0: bids}, {0: occupants}, {0: clicks},
+                   {0: [0] * len(occupants)}, {0: [0] * len(occupants)},
+                   len(bids))
+
+
+def kernels(clicks, reserve, bids):
+    """name -> function of no arguments calling that kernel on the case"""
+    slot = len(clicks) - 1
+    agent = seniorspringbb(len(bids), 100 * len(bids), 10 ** 9)
+    history = bb_history(clicks, bids)
+    return {
+        'gsp.compute': lambda: GSP.compute(clicks, reserve, bids),
+        'vcg.compute': lambda: VCG.compute(clicks, reserve, bids),
+        'gsp.bid_range_for_slot':
+            lambda: GSP.bid_range_for_slot(slot, clicks, reserve, bids),
+        'bb.bid': lambda: agent.bid(1, history, reserve),
+    }
+
+
+def cases(pattern=None):
+    """Yields (name, function) for every benchmark whose name matches the
+    regular expression pattern"""
+    for n in BIDDERS:
+        for slots in SLOTS:
+            for ties in TIES:
+                for reserve in RESERVES:
+                    inputs = None
+                    for kernel in ['gsp.compute', 'vcg.compute',
+                                   'gsp.bid_range_for_slot', 'bb.bid']:
+                        name = '%s n=%d slots=%d ties=%s reserve=%s' % (
+                            kernel, n, slots, ties, reserve)
+                        if pattern and not re.search(pattern, name):
+                            continue
+                        if inputs is None:
+                            inputs = kernels(*make_case(n, slots, ties,
+                                                        reserve))
+                        yield (name, inputs[kernel])
+
+
+def time_call(f, repeat=3, min_time=0.02):
+    """Seconds per call of f: the best of repeat measurements, each of
+    enough calls to take at least min_time"""
+    number = 1
+    while True:
+        start = default_timer()
+        for i in xrange(number):
+            f()
+        elapsed = default_timer() - start
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    best = elapsed / number
+    for r in range(repeat - 1):
+        start = default_timer()
+        for i in xrange(number):
+            f()
+        best = min(best, (default_timer() - start) / number)
+    return best
+
+
+def run(pattern=None, repeat=3, min_time=0.02):
+    """Returns name -> seconds per call for the matching benchmarks, and
+    for the reference workload"""
+    # The reference is timed all through the run, and its best time
+    # kept, so that a slow spell at any one point doesn't skew it
+    reference_times = [time_call(reference, repeat, min_time)]
+    results = {}
+    for (k, (name, f)) in enumerate(cases(pattern)):
+        # Same random stream for the tie-breaking shuffles every time
+        random.seed(0)
+        results[name] = time_call(f, repeat, min_time)
+        logging.info("%-60s %12.2f us" % (name, 1e6 * results[name]))
+        if k % REFERENCE_EVERY == REFERENCE_EVERY - 1:
+            reference_times.append(time_call(reference, repeat, min_time))
+    reference_times.append(time_call(reference, repeat, min_time))
+    results[REFERENCE] = min(reference_times)
+    logging.info("%-60s %12.2f us" % (REFERENCE, 1e6 * results[REFERENCE]))
+    return results
+
+
+def regressions(baseline, current, threshold):
+    """The benchmarks in both baseline and current (name -> seconds) that
+    got more than threshold (e.g. 0.2 for 20%) slower, as a list of
+    (name, baseline seconds, current seconds), worst first.  When both
+    have the reference workload, times are compared relative to it: the
+    current times are scaled by how much faster or slower the machine
+    ran it."""
+    scale = 1.0
+    if REFERENCE in baseline and REFERENCE in current:
+        scale = baseline[REFERENCE] / current[REFERENCE]
+    slow = [(name, baseline[name], t * scale)
+            for (name, t) in current.items()
+            if name in baseline and name != REFERENCE and
+            t * scale > baseline[name] * (1 + threshold)]
+    return sorted(slow, key=lambda (name, old, new): -new / old)
+
+
+def write_baseline(results, f):
+    json.dump({'python': platform.python_version(),
+               'machine': platform.machine(),
+               'results': results}, f, indent=1, sort_keys=True)
+    f.write('\n')
+
+
+def read_baseline(f):
+    return json.load(f)['results']
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options]"
+    parser = OptionParser(usage=usage_msg)
+
+    parser.add_option("--filter",
+                      dest="pattern", default=None,
+                      help="Only run benchmarks whose names match this regular expression")
+
+    parser.add_option("--repeat",
+                      dest="repeat", default=3, type="int",
+                      help="Measurements per benchmark; the best is kept")
+
+    parser.add_option("--min-time",
+                      dest="min_time", default=0.02, type="float",
+                      help="Minimum seconds per measurement")
+
+    parser.add_option("--save",
+                      dest="save", default=None,
+                      help="Write the results to this baseline file")
+
+    parser.add_option("--check",
+                      dest="check", default=None,
+                      help="Compare the results with this baseline file")
+
+    parser.add_option("--threshold",
+                      dest="threshold", default=0.25, type="float",
+                      help="Slowdown (as a fraction) that --check reports, e.g. 0.25 for 25%")
+
+    (options, args) = parser.parse_args(args[1:])
+    if args:
+        parser.error("unexpected arguments")
+
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    results = run(options.pattern, options.repeat, options.min_time)
+    if options.save:
+        with open(options.save, 'w') as f:
+            write_baseline(results, f)
+    if options.check:
+        with open(options.check) as f:
+            baseline = read_baseline(f)
+        slow = regressions(baseline, results, options.threshold)
+        for (name, old, new) in slow:
+            logging.warning("SLOWER %-60s %10.2f -> %10.2f us (%+.0f%%)" % (
+                name, 1e6 * old, 1e6 * new, 100 * (new / old - 1)))
+        logging.info("%d of %d benchmarks slower than the baseline by more "
+                     "than %.0f%%" % (len(slow), len(results) - 1,
+                                      100 * options.threshold))
+        if slow:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
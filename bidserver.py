@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+# Stand-in for an out-of-process bidding service.  Runs one ordinary
+# agent class and answers bid requests from remoteagent.RemoteAgent,
+# one JSON object per line on stdin/stdout.
+#
+# Requests:
+#   {"t": 0, "reserve": r}                      -> initial_bid
+#   {"t": t, "reserve": r, "round": {...}, "spent": [...]}  -> bid
+# where "round" is round t-1 (bids, occupants, clicks, per_click_payments,
+# slot_payments) and "spent" is history.agents_spent.  The server keeps
+# its own copy of the history built up from these.
+#
+# Replies: {"t": t, "bid": b}, or {"t": t, "error": message}
+
+from optparse import OptionParser
+import json
+import sys
+import time
+import traceback
+
+from history import History
+
+
+def serve(agent, infile, outfile, delay=0):
+    bids = {}
+    occupants = {}
+    clicks = {}
+    per_click_payments = {}
+    slot_payments = {}
+    history = History(bids, occupants, clicks,
+                      per_click_payments, slot_payments)
+
+    for line in iter(infile.readline, ''):
+        request = json.loads(line)
+        t = request['t']
+        try:
+            if 'round' in request:
+                r = request['round']
+                bids[t-1] = [tuple(b) for b in r['bids']]
+                occupants[t-1] = r['occupants']
+                clicks[t-1] = r['clicks']
+                per_click_payments[t-1] = r['per_click_payments']
+                slot_payments[t-1] = r['slot_payments']
+                history.n_agents = len(request['spent'])
+                history.agents_spent = request['spent']
+            if delay:
+                time.sleep(delay)
+            if t == 0:
+                b = agent.initial_bid(request['reserve'])
+            else:
+                b = agent.bid(t, history, request['reserve'])
+            reply = {'t': t, 'bid': b}
+        except Exception:
+            reply = {'t': t, 'error': traceback.format_exc()}
+        outfile.write(json.dumps(reply) + '\n')
+        outfile.flush()
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] AgentClass ID VALUE BUDGET"
+    parser = OptionParser(usage=usage_msg)
+    parser.add_option("--delay",
+                      dest="delay", default=0, type="float",
+                      help="Simulated service latency per request, in seconds")
+    (options, args) = parser.parse_args(args[1:])
+    if len(args) != 4:
+        parser.error("wrong number of arguments")
+
+    (class_name, id, value, budget) = args
+    module = __import__(class_name.lower())
+    agent = module.__dict__[class_name](int(id), int(value), int(budget))
+    serve(agent, sys.stdin, sys.stdout, options.delay)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+# Checkpoints for long permutation runs, so a killed run can pick up
+# where it left off instead of starting over.
+
+import cPickle as pickle
+import os
+
+# Options that don't affect the results, or that are filled in by
+# auction.configure rather than given on the command line
+IGNORED_OPTIONS = set(['checkpoint', 'checkpoint_interval', 'resume',
+                       'loglevel', 'agent_classes',
+                       'agent_values', 'bid_timer', 'tracer', 'metrics',
+                       'metrics_json', 'processes', 'scenario_set'])
+
+
+def fingerprint(options, agents_to_run):
+    """What a checkpoint has to agree with to be resumed: the agents and
+    the options that affect the simulation"""
+    config = sorted((k, v) for (k, v) in vars(options).items()
+                    if k not in IGNORED_OPTIONS)
+    return repr((list(agents_to_run), config))
+
+
+def save(path, state):
+    """Write state (a dict) to path atomically: a reader sees either the
+    previous checkpoint or this one, never part of one"""
+    tmp = '%s.tmp.%d' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+
+def load(path, key):
+    """Read the checkpoint at path.  Raises ValueError if it was written
+    for a configuration other than key (see fingerprint)."""
+    with open(path, 'rb') as f:
+        state = pickle.load(f)
+    if state.get('fingerprint') != key:
+        raise ValueError("Checkpoint %s was written by a run with different "
+                         "agents or options" % path)
+    return state
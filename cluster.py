@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+
+# Spread a permutation run over several machines.
+#
+# A coordinator (auction.py --listen HOST:PORT ...) splits the run into
+# tasks, each a batch of value assignments from one iteration, and hands
+# them out over TCP to workers (cluster.py HOST:PORT), one task per
+# worker at a time.  Workers run the simulations and send back a
+# RunResults for the task.  A task whose worker disconnects, or takes
+# longer than --task-timeout, is handed out again; the first result for
+# a task wins.
+#
+# Every simulation is seeded from its place in the run (see
+# auction.sim_seed) and task results are merged in task order, so the
+# totals are those of auction.run_permutations, whatever the task size,
+# however many workers there are and whichever of them ran what.
+# run_locally runs the same tasks in one process.
+#
+# Messages are pickles, each preceded by its length as a 4-byte
+# big-endian integer.  Unpickling runs code, so only connect machines
+# that trust each other.
+#   coordinator -> worker: ('config', options, agents, plan, run seed),
+#                          ('task', task id, task), ('done',)
+#   worker -> coordinator: ('result', task id, (RunResults, revenue))
+
+from optparse import OptionParser
+import cPickle as pickle
+import collections
+import logging
+import random
+import select
+import socket
+import struct
+import sys
+import time
+
+import auction
+
+# Options the workers don't need or can't use
+LOCAL_OPTIONS = set(['agent_classes', 'agent_values', 'bid_timer',
+                     'bid_log', 'day_log', 'checkpoint', 'resume',
+                     'listen', 'trace', 'tracer', 'scenario_set'])
+
+
+def send(sock, msg):
+    data = pickle.dumps(msg, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def recv(sock):
+    """The next message from sock; None if the connection closed"""
+    header = recv_exactly(sock, 4)
+    if header is None:
+        return None
+    (size,) = struct.unpack('!I', header)
+    data = recv_exactly(sock, size)
+    if data is None:
+        return None
+    return pickle.loads(data)
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)"""
+    (host, _, port) = address.rpartition(':')
+    return (host or 'localhost', int(port))
+
+
+def make_tasks(options, agents_to_run, plan, run_seed):
+    """Split the run into tasks: (iteration, index of the first
+    assignment, [(values, weight), ...]) with at most options.task_size
+    assignments each.  plan is what auction.plan_permutations returned."""
+    n = len(agents_to_run)
+    tasks = []
+    for i in range(options.iters):
+        (_, perms) = auction.assignments(options, n, plan, run_seed, i)
+        perms = list(perms)
+        for start in range(0, len(perms), options.task_size):
+            tasks.append((i, start, perms[start:start + options.task_size]))
+    return tasks
+
+
+def run_task(options, agents_to_run, plan, run_seed, task):
+    """Run one task's simulations.  Returns (RunResults, revenue), revenue
+    being the weighted total over the task's assignments."""
+    (i, start, perms) = task
+    (groups, share, _, _) = plan
+    n = len(agents_to_run)
+    results = auction.empty_results(options, agents_to_run, groups, share)
+    total_rev = 0
+    workspace = auction.Workspace()
+    for (j, (vals, weight)) in enumerate(perms, start):
+        random.seed(auction.sim_seed(run_seed, i, j))
+        options.agent_values = list(vals)
+        values = dict(zip(range(n), vals))
+        rev = 0
+        for history in auction.sim_days(options, workspace):
+            rev += auction.record(results, history, values, weight, groups,
+                                  share)
+        total_rev += weight * rev / options.days
+    return (results, total_rev)
+
+
+class Merger:
+    """
+    Merges task results in task order, whatever order they arrive in,
+    holding on to the ones that arrive early.
+    """
+    def __init__(self, options, agents_to_run, plan, tasks):
+        (groups, share, approx, num_perms) = plan
+        self.tasks = tasks
+        self.num_perms = num_perms
+        self.results = auction.empty_results(options, agents_to_run,
+                                             groups, share)
+        self.revenue = [0] * options.iters   # iteration -> total revenue
+        self.waiting = {}                    # task id -> outcome
+        self.next = 0
+
+    def add(self, task_id, outcome):
+        self.waiting[task_id] = outcome
+        while self.next in self.waiting:
+            (results, rev) = self.waiting.pop(self.next)
+            self.results.merge(results)
+            self.revenue[self.tasks[self.next][0]] += rev
+            self.next += 1
+
+    def finish(self):
+        """The merged RunResults, once every task is in"""
+        assert self.next == len(self.tasks)
+        for rev in self.revenue:
+            self.results.iteration_revenue.add(rev / float(self.num_perms))
+        return self.results
+
+
+def run_locally(options, agents_to_run):
+    """Run the coordinator's tasks in this process.  Gives the same
+    results as coordinate with any number of workers."""
+    (plan, run_seed) = auction.run_plan(options, agents_to_run)
+    tasks = make_tasks(options, agents_to_run, plan, run_seed)
+    merger = Merger(options, agents_to_run, plan, tasks)
+    for (task_id, task) in enumerate(tasks):
+        merger.add(task_id, run_task(options, agents_to_run, plan, run_seed,
+                                     task))
+    return merger.finish()
+
+
+def worker_options(options):
+    return dict((k, v) for (k, v) in vars(options).items()
+                if k not in LOCAL_OPTIONS)
+
+
+def coordinate(options, agents_to_run, server):
+    """
+    Hand out the run's tasks to the workers that connect to the
+    listening socket server, until every task has a result.  Returns the
+    merged RunResults.  Raises RuntimeError if there are tasks left but
+    no workers for options.worker_wait seconds.
+    """
+    (plan, run_seed) = auction.run_plan(options, agents_to_run)
+    tasks = make_tasks(options, agents_to_run, plan, run_seed)
+    merger = Merger(options, agents_to_run, plan, tasks)
+    config = ('config', worker_options(options), agents_to_run, plan,
+              run_seed)
+    logging.info("Coordinating %d tasks" % len(tasks))
+
+    todo = collections.deque(range(len(tasks)))
+    done = set()
+    reissued = set()
+    idle = []
+    busy = {}   # worker socket -> (task id, when it was handed out)
+    last_worker = time.time()
+
+    def lose(worker):
+        if worker in busy:
+            (task_id, _) = busy.pop(worker)
+            if task_id not in done:
+                logging.warning("Lost a worker; task %d will be retried"
+                                % task_id)
+                todo.appendleft(task_id)
+        if worker in idle:
+            idle.remove(worker)
+        worker.close()
+
+    while len(done) < len(tasks):
+        while idle and todo:
+            task_id = todo.popleft()
+            if task_id in done:
+                continue
+            worker = idle.pop()
+            try:
+                send(worker, ('task', task_id, tasks[task_id]))
+                busy[worker] = (task_id, time.time())
+            except socket.error:
+                todo.appendleft(task_id)
+                lose(worker)
+
+        (readable, _, _) = select.select([server] + idle + busy.keys(),
+                                         [], [], 1.0)
+        for sock in readable:
+            if sock is server:
+                (worker, _) = server.accept()
+                try:
+                    send(worker, config)
+                    idle.append(worker)
+                except socket.error:
+                    worker.close()
+                continue
+            try:
+                msg = recv(sock)
+            except socket.error:
+                msg = None
+            if msg is None:
+                lose(sock)
+                continue
+            (_, task_id, outcome) = msg
+            busy.pop(sock, None)
+            idle.append(sock)
+            if task_id not in done:
+                done.add(task_id)
+                merger.add(task_id, outcome)
+
+        now = time.time()
+        if idle or busy:
+            last_worker = now
+        elif now - last_worker > options.worker_wait:
+            raise RuntimeError("No workers for %d seconds with %d tasks "
+                               "left" % (options.worker_wait,
+                                         len(tasks) - len(done)))
+
+        # Stragglers: hand their tasks out again, once
+        for (task_id, start) in busy.values():
+            if (now - start > options.task_timeout and
+                task_id not in done and task_id not in reissued):
+                logging.warning("Task %d timed out; retrying it" % task_id)
+                reissued.add(task_id)
+                todo.append(task_id)
+
+    for worker in idle + busy.keys():
+        try:
+            send(worker, ('done',))
+        except socket.error:
+            pass
+        worker.close()
+    return merger.finish()
+
+
+def listen(address):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(address)
+    server.listen(16)
+    return server
+
+
+def work(address, connect_timeout=30):
+    """Connect to the coordinator at address and run tasks until it says
+    it's done (or goes away)"""
+    deadline = time.time() + connect_timeout
+    while True:
+        try:
+            sock = socket.create_connection(address)
+            break
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.2)
+
+    try:
+        msg = recv(sock)
+        if msg is None:
+            return
+        (_, config, agents_to_run, plan, run_seed) = msg
+        (options, _) = auction.build_parser().parse_args([])
+        for (k, v) in config.items():
+            setattr(options, k, v)
+        auction.configure(options, agents_to_run)
+        while True:
+            msg = recv(sock)
+            if msg is None or msg[0] == 'done':
+                return
+            (_, task_id, task) = msg
+            outcome = run_task(options, agents_to_run, plan, run_seed, task)
+            send(sock, ('result', task_id, outcome))
+    finally:
+        sock.close()
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] HOST:PORT"
+    parser = OptionParser(usage=usage_msg)
+    parser.add_option("--connect-timeout",
+                      dest="connect_timeout", default=30, type="float",
+                      help="Seconds to keep trying to reach the coordinator")
+    (options, args) = parser.parse_args(args[1:])
+    if len(args) != 1:
+        parser.error("expected the coordinator's HOST:PORT")
+
+    logging.basicConfig(format='%(message)s', level=logging.WARNING)
+    work(parse_address(args[0]), options.connect_timeout)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
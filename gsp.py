@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 
+import heapq
 import random
+from operator import itemgetter
 
 class GSP:
     """
@@ -23,6 +25,15 @@ class GSP:
             (in order)
          - per_click_payments is the corresponding payments.
         """
+        return GSP.price(slot_clicks, reserve, GSP.rank(reserve, bids))
+
+    @staticmethod
+    def rank(reserve, bids):
+        """
+        The bids (list of (id, bid) tuples) at or above the reserve,
+        highest first, with ties broken at random.  Both mechanisms
+        allocate by this order, so several can price one ranking.
+        """
         valid = lambda (a, bid): bid >= reserve
         valid_bids = filter(valid, bids)
 
@@ -31,7 +42,11 @@ class GSP:
         # higher ids
         random.shuffle(valid_bids)
         valid_bids.sort(rev_cmp_bids)
+        return valid_bids
 
+    @staticmethod
+    def price(slot_clicks, reserve, valid_bids):
+        """compute, given the bids already ranked (see rank)"""
         num_slots = len(slot_clicks)
         allocated_bids = valid_bids[:num_slots]
         if len(allocated_bids) == 0:
@@ -50,6 +65,24 @@ class GSP:
         per_click_payments.append(last_payment)
         return (list(allocation), per_click_payments)
 
+    @staticmethod
+    def top_bids(bids, k):
+        """
+        Return the k highest of bids (list of (id, bid) tuples), highest
+        first, with ties broken at random.  Only the candidates (the bids
+        at least as high as the k-th highest) are shuffled and sorted, so
+        this is O(n log k) plus the candidates' sort rather than a full
+        sort of a large population.
+        """
+        if len(bids) > k:
+            cutoff = heapq.nlargest(k, bids, key=itemgetter(1))[-1][1]
+            candidates = [(a, b) for (a, b) in bids if b >= cutoff]
+        else:
+            candidates = list(bids)
+        random.shuffle(candidates)
+        candidates.sort(key=itemgetter(1), reverse=True)
+        return candidates[:k]
+
     @staticmethod
     def bid_range_for_slot(slot, slot_clicks, reserve, bids):
         """
@@ -2,33 +2,211 @@
 
 import copy
 
+class BidSummary:
+    """
+    Compact statistics for the bids left out of a sparse round history:
+    how many there were, their total, and the lowest and highest.
+    """
+    def __init__(self, count, total, low, high):
+        self.count = count
+        self.total = total
+        self.low = low
+        self.high = high
+
+    @staticmethod
+    def of_others(bids, kept):
+        """Summarize the (id, bid) pairs in bids whose ids aren't in kept"""
+        kept_ids = set(a for (a, _) in kept)
+        rest = [b for (a, b) in bids if a not in kept_ids]
+        if len(rest) == 0:
+            return BidSummary(0, 0, None, None)
+        return BidSummary(len(rest), sum(rest), min(rest), max(rest))
+
+    def mean(self):
+        if self.count == 0:
+            return None
+        return self.total / float(self.count)
+
+    def __repr__(self):
+        return "BidSummary(count=%d, total=%s, low=%s, high=%s)" % (
+            self.count, self.total, self.low, self.high)
+
+
+class EvictedRoundError(LookupError):
+    """A round that a bounded-window history no longer keeps was asked for"""
+
+
+class RoundWindow:
+    """
+    Stand-in for the engine's round -> data dicts that keeps only the
+    last size rounds, in a ring buffer.  Rounds must be stored in order.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.items = [None] * size
+        self.last = -1
+
+    def __setitem__(self, t, value):
+        if t > self.last + 1 or t < self.last:
+            raise ValueError("rounds must be stored in order")
+        self.items[t % self.size] = value
+        self.last = t
+
+    def __getitem__(self, t):
+        if t < 0 or t > self.last:
+            raise KeyError(t)
+        if t <= self.last - self.size:
+            raise EvictedRoundError(
+                "round %d is no longer in the history: only the last %d "
+                "rounds (%d to %d) are kept" % (
+                    t, self.size, self.last - self.size + 1, self.last))
+        return self.items[t % self.size]
+
+    def __contains__(self, t):
+        return self.last - self.size < t <= self.last and t >= 0
+
+    def get(self, t, default=None):
+        if t in self:
+            return self.items[t % self.size]
+        return default
+
+    def keys(self):
+        return range(max(0, self.last - self.size + 1), self.last + 1)
+
+    def clear(self):
+        self.last = -1
+
+
+class Round(object):
+    """
+    One round as the engine stores it: the bids, and the slots'
+    occupants, clicks, per-click payments and total payments.  In
+    large-population mode bids only holds the winners and the first
+    loser, and bid_summary describes everyone else; otherwise
+    bid_summary is None.
+    """
+    __slots__ = ('bids', 'occupants', 'clicks', 'per_click_payments',
+                 'slot_payments', 'bid_summary')
+
+    def __init__(self, bids, occupants, clicks, per_click_payments,
+                 slot_payments, bid_summary=None):
+        self.bids = bids
+        self.occupants = occupants
+        self.clicks = clicks
+        self.per_click_payments = per_click_payments
+        self.slot_payments = slot_payments
+        self.bid_summary = bid_summary
+
+
+class ParallelRounds:
+    """
+    A round -> Round view of separate round -> data dicts, for
+    histories made with History's constructor.  It reads through, so the
+    dicts can be filled in after the History is made.
+    """
+    def __init__(self, bids, occupants, clicks, per_click_payments,
+                 slot_payments, bid_summaries):
+        self.bids = bids
+        self.occupants = occupants
+        self.clicks = clicks
+        self.per_click_payments = per_click_payments
+        self.slot_payments = slot_payments
+        self.bid_summaries = bid_summaries
+
+    def __getitem__(self, t):
+        return Round(self.bids[t], self.occupants[t], self.clicks[t],
+                     self.per_click_payments[t], self.slot_payments[t],
+                     self.bid_summaries.get(t))
+
+    def keys(self):
+        return self.bids.keys()
+
+
 class History:
-    class RoundHistory:
+    class RoundHistory(object):
         """
         Allows agents to access the history of a previous round.
         Makes copies so clients can't change history.
+
+        In large-population mode bids only holds the winners and the first
+        loser, and bid_summary describes everyone else.  Otherwise
+        bid_summary is None.
         """
+        __slots__ = ('bids', 'occupants', 'clicks', 'per_click_payments',
+                     'slot_payments', 'bid_summary')
+
         def __init__(self, bids, occupants, clicks,
-                     per_click_payments, slot_payments):
-            """Takes the info for a _single_ round."""
-            self.bids = copy.deepcopy(bids)
-            self.occupants = copy.deepcopy(occupants)
-            self.clicks = copy.deepcopy(clicks)
-            self.per_click_payments = copy.deepcopy(per_click_payments)
-            self.slot_payments = copy.deepcopy(slot_payments)
+                     per_click_payments, slot_payments, bid_summary=None):
+            """Takes the info for a _single_ round.  The lists only hold
+            numbers, ids and (id, bid) tuples, so copying the lists is as
+            good as a deep copy."""
+            self.bids = list(bids)
+            self.occupants = list(occupants)
+            self.clicks = list(clicks)
+            self.per_click_payments = list(per_click_payments)
+            self.slot_payments = list(slot_payments)
+            self.bid_summary = copy.copy(bid_summary)
 
     def __init__(self, bids, occupants, clicks,
-                 per_click_payments, slot_payments, n_agents=3):
-        self.round = lambda t: History.RoundHistory(
-            bids[t], occupants[t],
-            clicks[t], per_click_payments[t],
-            slot_payments[t])
+                 per_click_payments, slot_payments, n_agents=3,
+                 bid_summaries=None, window=None):
+        """The per-round arguments map round -> data: dicts, or
+        RoundWindows keeping the last window rounds.  Asking for a round
+        that has been dropped raises EvictedRoundError.  See also
+        of_rounds."""
+        bid_summaries = bid_summaries if bid_summaries is not None else {}
+        # round -> Round
+        self.rounds = ParallelRounds(bids, occupants, clicks,
+                                     per_click_payments, slot_payments,
+                                     bid_summaries)
+        # How many copies round() has handed out
+        self.materializations = 0
 
-        self.last_round = lambda : max(bids.keys())
         self.n_agents = n_agents
-        self.num_rounds = lambda : max(bids.keys()) + 1
         ## How much the agents spend.
         self.agents_spent = [0 for i in range(n_agents)]
+        # Rounds kept, or None if all of them are
+        self.window = window
+        # Running totals over all rounds, kept by the engine so they are
+        # known even when old rounds have been dropped
+        self.agents_utility = [0 for i in range(n_agents)]
+        self.revenue = 0
+        # Shadow mechanism name -> History of what it would have done
+        # with the same bids (see auction.sim)
+        self.shadows = {}
+
+    @staticmethod
+    def of_rounds(rounds, n_agents, window=None):
+        """A History of rounds, a round -> Round dict or RoundWindow"""
+        history = History({}, {}, {}, {}, {}, n_agents, None, window)
+        history.rounds = rounds
+        return history
+
+    def round(self, t):
+        self.materializations += 1
+        r = self.rounds[t]
+        return History.RoundHistory(r.bids, r.occupants, r.clicks,
+                                    r.per_click_payments, r.slot_payments,
+                                    r.bid_summary)
+
+    def record(self, t):
+        """Read-only, uncopied access to round t's Round for the engine
+        and statistics code.  Callers must not modify what they get."""
+        return self.rounds[t]
+
+    def peek(self, t):
+        """record(t) as a tuple: (bids, occupants, clicks,
+        per_click_payments, slot_payments).  Callers must not modify what
+        they get."""
+        r = self.rounds[t]
+        return (r.bids, r.occupants, r.clicks, r.per_click_payments,
+                r.slot_payments)
+
+    def last_round(self):
+        return max(self.rounds.keys())
+
+    def num_rounds(self):
+        return max(self.rounds.keys()) + 1
 
     def set_agent_spent(self, aid, spent):
         self.agents_spent[aid] = spent
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# Several keyword markets at once: every round, each agent bids in each of
+# config.markets slot auctions, and pays for all of them out of one
+# budget.  Market m has the daily click curve shifted by m * 48 / M
+# rounds (the keywords peak at different times of day) and runs the
+# m-th of config.market_mechanisms, cycling through them.
+#
+# Agents bid per market through bid(t, history, reserve) with that
+# market's History, or all at once through an optional
+# bid_markets(t, histories, reserve) returning a bid per market.  Every
+# market's History shares one agents_spent list, so agents see their
+# total spend.  As in auction.sim, the calls go through config.bid_timer
+# when there is one, an agent over the time limit keeping its previous
+# bids, and static bidders are only asked once unless
+# config.static_fast_path is off.  The markets' auctions are run as a batch each round,
+# ranking and pricing one market after the other with no per-market
+# setup.
+
+import math
+from timeit import default_timer
+
+import auction
+from gsp import GSP
+from history import History, Round, RoundWindow
+from metrics import Metrics
+from remoteagent import is_remote
+from replay import MECHANISMS
+
+
+def market_mechanisms(config):
+    """The mechanism class of each market"""
+    names = (getattr(config, 'market_mechanisms', None) or
+             config.mechanism).lower().split(',')
+    return [MECHANISMS[names[m % len(names)]] for m in range(config.markets)]
+
+
+def top_slot_clicks(m, markets, t):
+    """Expected clicks in market m's top slot in round t"""
+    shift = m * 48.0 / markets
+    return auction.iround(30 * math.cos(math.pi * (t + shift) / 24) + 50)
+
+
+def sim_markets(config, agents=None):
+    """
+    Runs one day of config.markets markets.  Returns a History of every
+    market's rounds in turn, round t * M + m being market m's round t,
+    so the statistics code sees the agents' totals over all markets.
+    Its markets attribute has each market's own History.  agents are
+    made from config unless given.
+    """
+    if agents is None:
+        agents = auction.init_agents(config)
+    if any(is_remote(a) for a in agents):
+        raise ValueError("Remote agents can't bid in several markets")
+    n = len(agents)
+    num_markets = config.markets
+    mechanisms = market_mechanisms(config)
+    reserve = config.reserve
+    budget = config.budget
+    by_id = dict((a.id, a) for a in agents)
+    num_slots = getattr(config, 'num_slots', None) or max(1, n - 1)
+    window = getattr(config, 'history_window', None)
+
+    def new_store(size):
+        return RoundWindow(size) if size else {}
+    markets = [History.of_rounds(new_store(window), n, window)
+               for m in range(num_markets)]
+    combined = History.of_rounds(
+        new_store(window and window * num_markets), n,
+        window and window * num_markets)
+    combined.markets = markets
+    # One budget: every market sees the same (lagged) spend
+    for h in markets:
+        h.agents_spent = combined.agents_spent
+    utility = combined.agents_utility
+    metrics = combined.metrics = Metrics()
+    phase_time = metrics.phase_time
+
+    # Spend ledger, id -> amount spent in the rounds run so far
+    spent = dict((a.id, 0) for a in agents)
+    static = set()
+    if getattr(config, 'static_fast_path', True):
+        static = set(a.id for a in agents if auction.is_static_bidder(a))
+    # current[m][i] is agent i's (id, bid) in market m
+    current = [[None] * n for m in range(num_markets)]
+    # Optional wall-time accounting and limit, shared with auction.sim
+    timer = getattr(config, 'bid_timer', None)
+
+    def call(a, method, fallback, *args):
+        metrics.agent_calls += 1
+        if timer is None:
+            return getattr(a, method)(*args)
+        return timer.call(a, method, fallback, *args)
+
+    def market_bids(i, a, t):
+        previous = [current[m][i][1] for m in range(num_markets)]
+        if hasattr(a, 'bid_markets'):
+            return call(a, 'bid_markets', previous, t, markets, reserve)
+        return [call(a, 'bid', previous[m], t, h, reserve)
+                for (m, h) in enumerate(markets)]
+
+    for t in range(config.num_rounds):
+        start = default_timer()
+        for (i, a) in enumerate(agents):
+            if t == 0:
+                bids = [call(a, 'initial_bid', 0, reserve)] * num_markets
+            elif a.id in static and t > 1:
+                metrics.cache_hits += 1
+                bids = None
+            else:
+                bids = market_bids(i, a, t)
+            if t > 0 and spent[a.id] >= budget:
+                # Out of money: bid zero everywhere
+                bids = [0] * num_markets
+            if bids is not None:
+                for m in range(num_markets):
+                    current[m][i] = (a.id, bids[m])
+        bidding_done = default_timer()
+        phase_time['agents'] += bidding_done - start
+
+        # The markets' auctions, as a batch
+        outcomes = []
+        for m in range(num_markets):
+            top = top_slot_clicks(m, num_markets, t)
+            clicks = [auction.iround(top * pow(config.dropoff, s))
+                      for s in range(num_slots)]
+            bids = list(current[m])
+            (occupants, per_click) = mechanisms[m].price(
+                clicks, reserve, GSP.rank(reserve, bids))
+            payments = [c * p for (c, p) in zip(clicks, per_click)]
+            outcomes.append(Round(bids, occupants, clicks, per_click,
+                                  payments))
+        metrics.mechanism_calls += num_markets
+        mechanism_done = default_timer()
+        phase_time['mechanism'] += mechanism_done - bidding_done
+
+        for (m, r) in enumerate(outcomes):
+            markets[m].rounds[t] = r
+            combined.rounds[t * num_markets + m] = r
+            for (agent_id, c, p, paid) in zip(r.occupants, r.clicks,
+                                              r.per_click_payments,
+                                              r.slot_payments):
+                spent[agent_id] += paid
+                utility[agent_id] += c * (by_id[agent_id].value - p)
+            combined.revenue += sum(r.slot_payments)
+        # After round t, agents see spend through (not including) round t
+        if t > 0:
+            for h in markets:
+                previous = h.rounds[t - 1]
+                for (agent_id, paid) in zip(previous.occupants,
+                                            previous.slot_payments):
+                    combined.agents_spent[agent_id] += paid
+        phase_time['accounting'] += default_timer() - mechanism_done
+
+    for a in agents:
+        combined.set_agent_spent(a.id, spent[a.id])
+    metrics.sims = 1
+    metrics.rounds = config.num_rounds * num_markets
+    metrics.peak_history = len(combined.rounds.keys())
+    metrics.history_materializations = sum(h.materializations
+                                           for h in markets)
+    return combined
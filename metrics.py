@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+# Counters for how much work the engine does, to track its efficiency.
+
+import json
+import logging
+
+# Where a round's wall time goes: getting the agents' bids, running the
+# mechanism, and the payments, utilities and trace that follow
+PHASES = ['agents', 'mechanism', 'accounting']
+
+
+class Metrics:
+    """
+    Work done by one simulation, or by a whole run when merged: rounds
+    simulated, mechanism calls, agent calls, history materializations
+    (History.round copies handed out), cache hits (static bids reused
+    instead of asking the agent again), wall time per phase and the most
+    rounds of history held at once.
+    """
+    def __init__(self):
+        self.sims = 0
+        self.rounds = 0
+        self.mechanism_calls = 0
+        self.agent_calls = 0
+        self.history_materializations = 0
+        self.cache_hits = 0
+        self.peak_history = 0
+        self.phase_time = dict((p, 0.0) for p in PHASES)
+
+    def merge(self, other):
+        for name in ['sims', 'rounds', 'mechanism_calls', 'agent_calls',
+                     'history_materializations', 'cache_hits']:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.peak_history = max(self.peak_history, other.peak_history)
+        for (p, elapsed) in other.phase_time.items():
+            self.phase_time[p] = self.phase_time.get(p, 0.0) + elapsed
+        return self
+
+    def wall_time(self):
+        return sum(self.phase_time.values())
+
+    def throughput(self):
+        """Auctions (rounds) per second of engine time"""
+        wall = self.wall_time()
+        return self.rounds / wall if wall > 0 else 0.0
+
+    def as_dict(self):
+        return {'sims': self.sims, 'rounds': self.rounds,
+                'mechanism_calls': self.mechanism_calls,
+                'agent_calls': self.agent_calls,
+                'history_materializations': self.history_materializations,
+                'cache_hits': self.cache_hits,
+                'peak_history': self.peak_history,
+                'phase_time': dict(self.phase_time),
+                'wall_time': self.wall_time(),
+                'throughput': self.throughput()}
+
+    def write_json(self, f):
+        json.dump(self.as_dict(), f, indent=1, sort_keys=True)
+        f.write('\n')
+
+    def summary(self):
+        """Returns the summary as a list of lines"""
+        lines = ["%-26s %12d" % (name, getattr(self, name))
+                 for name in ['sims', 'rounds', 'mechanism_calls',
+                              'agent_calls', 'history_materializations',
+                              'cache_hits', 'peak_history']]
+        wall = self.wall_time()
+        for p in sorted(self.phase_time, key=lambda p: -self.phase_time[p]):
+            lines.append("%-26s %12.3f s (%.0f%%)" % (
+                p + " time", self.phase_time[p],
+                100.0 * self.phase_time[p] / wall if wall > 0 else 0))
+        lines.append("%-26s %12.0f auctions/s" % ("throughput",
+                                                   self.throughput()))
+        return lines
+
+    def log_summary(self):
+        logging.info("Engine metrics:")
+        for line in self.summary():
+            logging.info(line)
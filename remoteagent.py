@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+# Agents that run out of process.  A RemoteAgent is a proxy that sends
+# bid requests to a bidding service (here, bidserver.py in a subprocess)
+# and reads the replies from a pipe.  gather_bids asks a whole set of
+# them for their bids at once and waits until they have all answered or
+# a deadline passes, so a round takes as long as the slowest service
+# rather than the sum of all of them.
+
+import json
+import os
+import select
+import subprocess
+import sys
+import time
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      'bidserver.py')
+
+
+class RemoteAgent:
+    """Proxy for an agent whose bids come from a bidding service"""
+    # Name of the agent class the service runs; see remote_class
+    strategy = None
+    # Extra bidserver.py options, e.g. ['--delay', '0.05']
+    server_args = []
+    static_bid = False
+
+    def __init__(self, id, value, budget):
+        self.id = id
+        self.value = value
+        self.budget = budget
+        self.process = None
+        self.failed = False
+        self.buffer = ''
+        self.replies = {}   # round -> bid, or None if the service failed
+
+    def start(self):
+        command = ([sys.executable, SERVER] + list(self.server_args) +
+                   [self.strategy, str(self.id), str(self.value),
+                    str(self.budget)])
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE, bufsize=0)
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def request_bid(self, t, history, reserve):
+        """Send the request for round t's bid, along with the previous
+        round's results, without waiting for the reply."""
+        if self.process is None:
+            self.start()
+        request = {'t': t, 'reserve': reserve}
+        if t > 0:
+            r = history.round(t-1)
+            request['round'] = {'bids': r.bids,
+                                'occupants': r.occupants,
+                                'clicks': r.clicks,
+                                'per_click_payments': r.per_click_payments,
+                                'slot_payments': r.slot_payments}
+            request['spent'] = history.agents_spent
+        try:
+            self.process.stdin.write(json.dumps(request) + '\n')
+        except (IOError, OSError):
+            self.failed = True
+
+    def read_replies(self):
+        """Read whatever the service has sent so far.  Call when fileno()
+        is readable."""
+        data = os.read(self.fileno(), 65536)
+        if not data:
+            self.failed = True
+            return
+        self.buffer += data
+        while '\n' in self.buffer:
+            (line, self.buffer) = self.buffer.split('\n', 1)
+            reply = json.loads(line)
+            self.replies[reply['t']] = reply.get('bid')
+
+    def has_reply(self, t):
+        return self.failed or t in self.replies
+
+    def take_reply(self, t):
+        """Returns the bid for round t, or None if there isn't one.
+        Replies to earlier rounds that came too late are dropped."""
+        bid = self.replies.pop(t, None)
+        for stale in [k for k in self.replies if k < t]:
+            del self.replies[stale]
+        return bid
+
+    def initial_bid(self, reserve):
+        return gather_bids([self], 0, None, reserve).get(self.id, 0)
+
+    def bid(self, t, history, reserve):
+        return gather_bids([self], t, history, reserve).get(self.id, 0)
+
+    def close(self):
+        if self.process is not None:
+            self.process.stdin.close()
+            # Don't wait for answers to requests nobody will read
+            if self.process.poll() is None:
+                self.process.terminate()
+            self.process.wait()
+            self.process = None
+
+    def __repr__(self):
+        return "%s(id=%d, value=%d)" % (
+            self.__class__.__name__, self.id, self.value)
+
+
+def is_remote(agent):
+    return hasattr(agent, 'request_bid')
+
+
+def remote_class(strategy, server_args=()):
+    """Returns a RemoteAgent subclass whose service runs agent class
+    strategy (loaded from module strategy.lower())"""
+    class Remote(RemoteAgent):
+        pass
+    Remote.__name__ = 'Remote' + strategy
+    Remote.strategy = strategy
+    Remote.server_args = list(server_args)
+    return Remote
+
+
+def gather_bids(agents, t, history, reserve, deadline=None):
+    """
+    Ask every remote agent in agents for its round t bid (the initial bid
+    if t == 0) concurrently, and wait up to deadline seconds (forever if
+    None) for the replies.
+
+    Returns a dict id -> bid for the agents that answered in time.  Agents
+    that were late, failed, or returned an error are left out, so the
+    caller can substitute their previous bid.
+    """
+    for a in agents:
+        a.request_bid(t, history, reserve)
+    pending = dict((a.fileno(), a) for a in agents if not a.failed)
+
+    end = None if deadline is None else time.time() + deadline
+    while pending:
+        timeout = None
+        if end is not None:
+            timeout = end - time.time()
+            if timeout <= 0:
+                break
+        (readable, _, _) = select.select(pending.keys(), [], [], timeout)
+        for fd in readable:
+            a = pending[fd]
+            a.read_replies()
+            if a.has_reply(t):
+                del pending[fd]
+
+    bids = {}
+    for a in agents:
+        b = a.take_reply(t)
+        if b is not None:
+            bids[a.id] = b
+    return bids
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+
+# Re-price recorded auctions under a different mechanism or reserve,
+# without running any agents.
+#
+# A bid log has one JSON record per round:
+#   {"clicks": [80, 60, 45], "bids": [[0, 120], [1, 75], ...],
+#    "values": {"0": 150, "1": 90, ...}}
+# "values" (per-click values, used for utilities) is optional and carries
+# over to later rounds, so a simulated day only needs it in round 0.
+# "weight", given along with "values", is how many value permutations
+# the simulation stands for when a run only simulates the distinct ones
+# (see auction.record).  It also carries over, and is 1 if not given.
+# Replayed totals count each round weight times, as the run's own
+# totals do.
+
+from optparse import OptionParser
+import itertools
+import json
+import logging
+import random
+import sys
+
+from gsp import GSP
+from vcg import VCG
+
+MECHANISMS = {'gsp': GSP, 'vcg': VCG}
+
+
+def write_history(history, values, f, weight=1):
+    """Append every round of history to the open bid log f.  values is
+    the dict id->value the simulation was run with, and weight how many
+    permutations it stands for."""
+    for t in range(history.num_rounds()):
+        r = history.round(t)
+        record = {'clicks': r.clicks, 'bids': r.bids}
+        if t == 0:
+            record['values'] = values
+            if weight != 1:
+                record['weight'] = weight
+        f.write(json.dumps(record))
+        f.write('\n')
+
+
+def rounds_from_history(history, values, weight=1):
+    """Yields (clicks, bids, values, weight) for each round of a History"""
+    for t in range(history.num_rounds()):
+        r = history.round(t)
+        yield (r.clicks, r.bids, values, weight)
+
+
+def read_log(f):
+    """Yields (clicks, bids, values, weight) for each record in the open
+    bid log f, one line at a time.  values is None until the log gives
+    some."""
+    values = None
+    weight = 1
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if 'values' in record:
+            values = dict((int(k), v) for (k, v) in record['values'].items())
+            weight = record.get('weight', 1)
+        bids = [(a, b) for (a, b) in record['bids']]
+        yield (record['clicks'], bids, values, weight)
+
+
+class ReplayResult:
+    """Revenue and per-bidder totals over a set of replayed rounds, each
+    counted as many times as its weight (rounds too)"""
+    def __init__(self):
+        self.rounds = 0
+        self.revenue = 0
+        self.spend = {}    # id -> total payment
+        self.clicks = {}   # id -> total clicks received
+        self.utility = {}  # id -> total utility; only for bidders with values
+
+    def merge(self, other):
+        self.rounds += other.rounds
+        self.revenue += other.revenue
+        for (mine, theirs) in [(self.spend, other.spend),
+                               (self.clicks, other.clicks),
+                               (self.utility, other.utility)]:
+            for (k, v) in theirs.items():
+                mine[k] = mine.get(k, 0) + v
+        return self
+
+    def report(self):
+        """Returns the results as a list of lines"""
+        lines = ["Replayed %d rounds.  Revenue $%.2f" % (
+            self.rounds, 0.01 * self.revenue)]
+        for k in sorted(set(self.spend) | set(self.utility)):
+            line = "Bidder %s: clicks %d, spend $%.2f" % (
+                k, self.clicks.get(k, 0), 0.01 * self.spend.get(k, 0))
+            if k in self.utility:
+                line += ", utility $%.2f" % (0.01 * self.utility[k])
+            lines.append(line)
+        return lines
+
+
+def price_rounds(mechanism, reserve, rounds):
+    """Run mechanism over a list of (clicks, bids, values, weight) rounds.
+    Returns a ReplayResult."""
+    result = ReplayResult()
+    for (clicks, bids, values, weight) in rounds:
+        (occupants, per_click) = mechanism.compute(clicks, reserve, bids)
+        result.rounds += weight
+        for (a, c, p) in zip(occupants, clicks, per_click):
+            payment = weight * c * p
+            result.revenue += payment
+            result.spend[a] = result.spend.get(a, 0) + payment
+            result.clicks[a] = result.clicks.get(a, 0) + weight * c
+            if values is not None and a in values:
+                result.utility[a] = (result.utility.get(a, 0) +
+                                     weight * c * (values[a] - p))
+    return result
+
+
+def _price_chunk(args):
+    """Pool worker: args is (mechanism name, reserve, seed, rounds).  The
+    mechanisms break ties with the random module, which is reseeded for
+    the chunk and restored afterwards, since without a pool this runs in
+    the caller's process."""
+    (mech, reserve, seed, rounds) = args
+    state = random.getstate()
+    random.seed(seed)
+    try:
+        return price_rounds(MECHANISMS[mech], reserve, rounds)
+    finally:
+        random.setstate(state)
+
+
+def chunks(rounds, chunk_size):
+    """Split an iterable of rounds into lists of at most chunk_size"""
+    rounds = iter(rounds)
+    while True:
+        chunk = list(itertools.islice(rounds, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def replay(rounds, mech='gsp', reserve=0, chunk_size=1000, processes=1,
+           seed=None):
+    """
+    Price an iterable of (clicks, bids, values, weight) rounds with
+    mechanism mech ('gsp' or 'vcg') and the given reserve.  rounds is
+    consumed chunk_size rounds at a time, so arbitrarily long logs use
+    bounded memory.  With processes > 1 chunks are priced in parallel.
+
+    Ties are broken at random; seed makes the result reproducible (each
+    chunk gets its own seed derived from it, so results don't depend on
+    processes).
+    """
+    if mech not in MECHANISMS:
+        raise ValueError("mechanism must be one of 'gsp' or 'vcg'")
+    seeder = random.Random(seed)
+    tasks = ((mech, reserve, seeder.getrandbits(32), chunk)
+             for chunk in chunks(rounds, chunk_size))
+
+    total = ReplayResult()
+    if processes > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            # A few chunks per worker at a time keeps memory bounded
+            for wave in chunks(tasks, 2 * processes):
+                for part in pool.map(_price_chunk, wave):
+                    total.merge(part)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for part in itertools.imap(_price_chunk, tasks):
+            total.merge(part)
+    return total
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] BIDLOG"
+    parser = OptionParser(usage=usage_msg)
+
+    parser.add_option("--mech",
+                      dest="mechanism", default="gsp",
+                      help="Set the mechanism: 'gsp' or 'vcg'")
+
+    parser.add_option("--reserve",
+                      dest="reserve", default=0, type="int",
+                      help="Reserve price, in cents")
+
+    parser.add_option("--chunk-size",
+                      dest="chunk_size", default=1000, type="int",
+                      help="Number of rounds to read and price at a time")
+
+    parser.add_option("--processes",
+                      dest="processes", default=1, type="int",
+                      help="Number of worker processes pricing chunks")
+
+    parser.add_option("--seed",
+                      dest="seed", default=None, type="int",
+                      help="seed for tie-breaking")
+
+    (options, args) = parser.parse_args(args[1:])
+    if len(args) != 1:
+        parser.error("expected a single bid log file")
+
+    logging.basicConfig(format='%(message)s', level=logging.INFO)
+    with open(args[0]) as f:
+        result = replay(read_log(f), options.mechanism.lower(),
+                        options.reserve, options.chunk_size,
+                        options.processes, options.seed)
+    for line in result.report():
+        logging.info(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
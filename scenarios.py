@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+
+# Scenario sets: a permutation run's value draws and the value
+# assignments simulated for each, generated once and stored in a compact
+# binary file, so that any number of runs (other mechanisms, reserves or
+# agent mixes, and the workers of a parallel run) simulate exactly the
+# same scenarios instead of each drawing its own.  The file also holds
+# the run seed, so each simulation gets the same random numbers too (see
+# auction.sim_seed).  Runs read it through a memory map: opening a set
+# costs nothing however big it is, and processes reading the same file
+# share its pages.
+#
+# Layout, little-endian:
+#   header   magic 'ASCN', version, n agents, iterations, weight size w,
+#            whether the assignments are distinct ones shared by a class
+#            (see auction.plan_permutations), whether they are a sample,
+#            run seed, then the total weight per iteration (w bytes)
+#   groups   n int32, each agent's class group
+#   index    iterations + 1 uint64, the first assignment of each
+#            iteration (the last is the number of assignments)
+#   draws    iterations * n int32, the value draws
+#   records  per assignment, its weight (w bytes, big-endian) and its
+#            n int32 values
+
+import mmap
+import os
+import struct
+
+MAGIC = 'ASCN'
+VERSION = 1
+HEADER = struct.Struct('<4sHIIH??Q')
+
+
+def int_to_bytes(x, size):
+    return ('%0*x' % (2 * size, x)).decode('hex')
+
+
+def bytes_to_int(s):
+    return int(s.encode('hex'), 16)
+
+
+def write(path, n, iters, plan, run_seed, scenarios):
+    """
+    Write a scenario set to path.  plan is what auction.plan_permutations
+    returned, and scenarios yields (draw, assignments) for each
+    iteration, assignments being (values, weight) pairs.  The file is
+    written under another name and renamed into place, so a reader never
+    sees part of one.
+    """
+    (groups, share, approx, num_perms) = plan
+    size = max(1, (num_perms.bit_length() + 7) // 8)
+    group_of = [0] * n
+    for (g, members) in enumerate(groups):
+        for id in members:
+            group_of[id] = g
+    values = struct.Struct('<%di' % n)
+    index = [0]
+    draws = []
+
+    tmp = '%s.tmp.%d' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, n, iters, size, share, approx,
+                            run_seed))
+        f.write(int_to_bytes(num_perms, size))
+        f.write(values.pack(*group_of))
+        # Room for the index and draws, written once they are known
+        f.write('\0' * (8 * (iters + 1) + values.size * iters))
+        for (draw, perms) in scenarios:
+            draws.append(draw)
+            count = index[-1]
+            for (vals, weight) in perms:
+                f.write(int_to_bytes(weight, size))
+                f.write(values.pack(*vals))
+                count += 1
+            index.append(count)
+        assert len(draws) == iters
+        f.seek(HEADER.size + size + values.size)
+        f.write(struct.pack('<%dQ' % (iters + 1), *index))
+        for draw in draws:
+            f.write(values.pack(*draw))
+        f.flush()
+        os.fsync(f.fileno())
+    os.rename(tmp, path)
+
+
+class ScenarioSet:
+    """
+    A scenario set file, memory-mapped.  n, iters, run_seed and plan (in
+    the form auction.plan_permutations returns) describe the run it was
+    made for; draw(i) and assignments(i) read iteration i's scenarios.
+    Pickles as its path, so a process it is handed to maps the file
+    itself.  Raises ValueError if path isn't a scenario set.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, n, iters, size, share, approx,
+             self.run_seed) = HEADER.unpack_from(self.map, 0)
+        except struct.error:
+            magic = None
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s isn't a scenario set" % path)
+        self.n = n
+        self.iters = iters
+        self.weight_size = size
+        self.values = struct.Struct('<%di' % n)
+        offset = HEADER.size
+        num_perms = bytes_to_int(self.map[offset:offset + size])
+        offset += size
+        group_of = self.values.unpack_from(self.map, offset)
+        groups = [[id for id in range(n) if group_of[id] == g]
+                  for g in range(max(group_of) + 1)]
+        self.plan = (groups, share, approx, num_perms)
+        self.index_offset = offset + self.values.size
+        self.draws_offset = self.index_offset + 8 * (iters + 1)
+        self.records_offset = self.draws_offset + self.values.size * iters
+        self.record_size = size + self.values.size
+
+    def first(self, i):
+        """The number of assignments before iteration i's"""
+        return struct.unpack_from('<Q', self.map, self.index_offset + 8 * i)[0]
+
+    def draw(self, i):
+        return list(self.values.unpack_from(
+            self.map, self.draws_offset + self.values.size * i))
+
+    def assignments(self, i):
+        """Yields iteration i's (values, weight) assignments"""
+        size = self.weight_size
+        for k in xrange(self.first(i), self.first(i + 1)):
+            offset = self.records_offset + self.record_size * k
+            weight = bytes_to_int(self.map[offset:offset + size])
+            yield (list(self.values.unpack_from(self.map, offset + size)),
+                   weight)
+
+    def check(self, agents_to_run, iters):
+        """Raises ValueError unless a run of agents_to_run (as class
+        names) for iters iterations can use this set"""
+        if len(agents_to_run) != self.n:
+            raise ValueError("Scenario set %s is for %d agents, not %d" % (
+                self.path, self.n, len(agents_to_run)))
+        if iters > self.iters:
+            raise ValueError("Scenario set %s only has %d iterations" % (
+                self.path, self.iters))
+        (groups, share, _, _) = self.plan
+        if share and any(agents_to_run[id] != agents_to_run[g[0]]
+                         for g in groups for id in g):
+            # A class's agents share the assignments' weights
+            raise ValueError("Scenario set %s has distinct assignments for "
+                             "other agent classes; make it with --all-perms "
+                             "to run other agent mixes" % self.path)
+
+    def close(self):
+        self.map.close()
+
+    def __getstate__(self):
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
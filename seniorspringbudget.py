@@ -10,13 +10,22 @@ from random import randint
 # aggressive factor for projection (overestimating other agents' bids)
 AGG_FACT = float(1.001)
 
-class seniorspringbudget:
+class seniorspringbudget(object):
     """Balanced bidding agent"""
+    # bid_predictor looks at every other agent's bid
+    needs_all_bids = True
+    __slots__ = ('id', 'value', 'budget')
+
     def __init__(self, id, value, budget):
         self.id = id
         self.value = value
         self.budget = budget
 
+    def reset(self, value, budget):
+        """Get ready for another simulation, as if newly made"""
+        self.value = value
+        self.budget = budget
+
     def initial_bid(self, reserve):
         return self.value / 2
 
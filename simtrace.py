@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# Structured per-round trace of simulations, for debugging.
+#
+# One JSON object per line.  Each traced simulation starts with
+#   {"sim": k, "values": {id: value}, "mechanism": "gsp", "reserve": r}
+# followed by a record for each traced round:
+#   {"sim": k, "t": t, "bids": [[id, bid], ...], "occupants": [...],
+#    "clicks": [...], "per_click": [...], "payments": [...],
+#    "utility": [...], "spent": {id: total}}
+# where utility[s] is the round's utility of the occupant of slot s and
+# spent is every agent's spend through round t.
+
+import json
+import os
+
+
+class Tracer:
+    """
+    Writes trace records to the open file f.  Only every every_sim-th
+    simulation and, within those, every every_round-th round is traced.
+    sim() asks wants(t) before building a record, so rounds that aren't
+    traced cost a method call and nothing is formatted for them.
+    """
+    def __init__(self, f, every_sim=1, every_round=1):
+        self.f = f
+        self.every_sim = every_sim
+        self.every_round = every_round
+        self.sims = 0        # simulations started
+        self.tracing = False
+
+    def start_sim(self, values, mechanism, reserve):
+        """Call at the start of each simulation, with its values (a dict
+        id -> value).  Returns whether it is being traced."""
+        self.sim = self.sims
+        self.sims += 1
+        self.tracing = self.sim % self.every_sim == 0
+        if self.tracing:
+            self.write({'sim': self.sim, 'values': values,
+                        'mechanism': mechanism, 'reserve': reserve})
+        return self.tracing
+
+    def wants(self, t):
+        return self.tracing and t % self.every_round == 0
+
+    def round(self, t, bids, occupants, clicks, per_click, payments,
+              utility, spent):
+        self.write({'sim': self.sim, 't': t, 'bids': bids,
+                    'occupants': occupants, 'clicks': clicks,
+                    'per_click': per_click, 'payments': payments,
+                    'utility': utility, 'spent': spent})
+
+    def position(self):
+        """(file size, simulations started): what resume needs to carry
+        on from this point"""
+        self.f.flush()
+        return (self.f.tell(), self.sims)
+
+    def resume(self, position):
+        """Drop whatever was written after position (see position()) and
+        carry on from there"""
+        (size, sims) = position
+        self.f.truncate(size)
+        self.f.seek(0, 2)
+        self.sims = sims
+
+    def write(self, record):
+        self.f.write(json.dumps(record, separators=(',', ':')))
+        self.f.write('\n')
+
+    def close(self):
+        self.f.close()
+
+
+def open_tracer(path, every_sim=1, every_round=1, keep=False):
+    """A Tracer writing to path through a 64k buffer.  With keep, an
+    existing trace is kept for a resumed run to truncate (see
+    Tracer.resume) instead of being emptied."""
+    mode = 'r+' if keep and os.path.exists(path) else 'w'
+    return Tracer(open(path, mode, 1 << 16), every_sim, every_round)
+
+
+def read_trace(f):
+    """Yields the records of the open trace file f"""
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
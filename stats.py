@@ -36,6 +36,33 @@ class Stats:
             rev += sum(r.slot_payments)
         return rev
 
+    def totals(self, n=None):
+        """
+        Every agent's total utility and spend, and the total revenue, in
+        one pass over the rounds.  Returns (utility, spend, revenue) where
+        utility and spend are lists indexed by agent id; n defaults to the
+        number of agents with values.
+        """
+        if n is None:
+            n = len(self.values)
+        if self.history.window is not None:
+            # Old rounds are gone; the engine kept running totals
+            return (self.history.agents_utility[:n],
+                    self.history.agents_spent[:n], self.history.revenue)
+        utility = [0] * n
+        spend = [0] * n
+        revenue = 0
+        values = self.values
+        for t in range(self.history.num_rounds()):
+            r = self.history.record(t)
+            for (id, c, p, paid) in zip(r.occupants, r.clicks,
+                                        r.per_click_payments,
+                                        r.slot_payments):
+                utility[id] += c * (values[id] - p)
+                spend[id] += paid
+            revenue += sum(r.slot_payments)
+        return (utility, spend, revenue)
+
     def __repr__(self):
         return "Stats(history with %d rounds, vals %s)" % (
             self.history.last_round() + 1,
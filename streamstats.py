@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+
+# Statistics accumulated one sample at a time, without keeping the
+# samples.  Everything here can be merged, so workers can each
+# accumulate their share of the samples and the results be combined.
+
+import math
+
+# Two-sided 95% normal quantile
+Z95 = 1.959964
+
+
+class QuantileSketch:
+    """
+    Approximate quantiles in bounded memory (a KLL-style compactor
+    sketch).  Level h holds items that each stand for 2**h samples; when
+    a level fills up it is sorted and every other item is promoted to
+    the next level.  Capacities shrink geometrically going down from the
+    top level, so the sketch holds about 3*k items however many samples
+    it has seen.  Compaction alternates between keeping the odd and even
+    items instead of flipping a coin, so the sketch never touches the
+    random module's state.
+    """
+    def __init__(self, k=64):
+        self.k = k
+        self.levels = [[]]
+        self.odd = 0
+
+    def capacity(self, h):
+        depth = len(self.levels) - 1 - h
+        return max(2, int(self.k * (2.0 / 3) ** depth))
+
+    def add(self, x, weight=1):
+        """Add x, standing for weight (a positive integer) samples"""
+        h = 0
+        while weight:
+            if weight & 1:
+                while len(self.levels) <= h:
+                    self.levels.append([])
+                self.levels[h].append(x)
+            weight >>= 1
+            h += 1
+        self.compress()
+
+    def compress(self):
+        h = 0
+        while h < len(self.levels):
+            if len(self.levels[h]) >= self.capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[h])
+                keep = []
+                if len(items) % 2:
+                    keep = [items.pop()]
+                self.levels[h + 1].extend(items[self.odd::2])
+                self.odd ^= 1
+                self.levels[h] = keep
+            h += 1
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for (h, items) in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.compress()
+        return self
+
+    def quantile(self, q):
+        """The approximate q-quantile (0 <= q <= 1); None if empty"""
+        weighted = sorted((x, 2 ** h) for (h, items) in enumerate(self.levels)
+                          for x in items)
+        if not weighted:
+            return None
+        target = q * sum(w for (_, w) in weighted)
+        seen = 0
+        for (x, w) in weighted:
+            seen += w
+            if seen >= target:
+                return x
+        return weighted[-1][0]
+
+
+class RunningStat:
+    """
+    Streaming mean and variance (Welford's algorithm), min, max and
+    approximate quantiles of a metric.  Samples may carry an integer
+    weight, counting as that many copies; n is the total weight.
+    sketch_size=None skips the quantile sketch, for cheap bulk use.
+    """
+    def __init__(self, sketch_size=64):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.sketch = None
+        if sketch_size:
+            self.sketch = QuantileSketch(sketch_size)
+
+    def add(self, x, weight=1):
+        self.n += weight
+        delta = x - self.mean
+        self.mean += delta * weight / self.n
+        self.m2 += weight * delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+        if self.sketch is not None:
+            self.sketch.add(x, weight)
+
+    def merge(self, other):
+        """Fold in the samples of other (Chan et al.'s parallel update)"""
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta * delta * self.n * other.n / float(n)
+        self.mean += delta * other.n / float(n)
+        self.n = n
+        for x in [other.min, other.max]:
+            if self.min is None or x < self.min:
+                self.min = x
+            if self.max is None or x > self.max:
+                self.max = x
+        if self.sketch is not None and other.sketch is not None:
+            self.sketch.merge(other.sketch)
+        return self
+
+    def variance(self):
+        """Sample variance; 0 with fewer than two samples"""
+        if self.n < 2:
+            return 0.0
+        return self.m2 / (self.n - 1)
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def pstddev(self):
+        """Population standard deviation, as util.stddev computes"""
+        if self.n == 0:
+            return 0.0
+        return math.sqrt(self.m2 / self.n)
+
+    def quantile(self, q):
+        """The approximate q-quantile; None without a sketch"""
+        if self.sketch is None:
+            return None
+        return self.sketch.quantile(q)
+
+    def ci_halfwidth(self, z=Z95):
+        """Half the width of the normal confidence interval on the mean.
+        Infinite with fewer than two samples."""
+        if self.n < 2:
+            return float('inf')
+        return z * math.sqrt(self.variance() / self.n)
+
+    def summary(self):
+        """The statistics as a dict, e.g. for writing out as JSON"""
+        return {'n': self.n, 'mean': self.mean, 'stddev': self.stddev(),
+                'min': self.min, 'max': self.max,
+                'p05': self.quantile(0.05), 'p50': self.quantile(0.5),
+                'p95': self.quantile(0.95)}
+
+    def __repr__(self):
+        return "RunningStat(n=%d, mean=%s, stddev=%s)" % (
+            self.n, self.mean, self.stddev())
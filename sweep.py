@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+# Parameter sweeps over auction.py configurations, with a result cache.
+#
+# A grid spec is a JSON object whose keys are auction.py option names
+# (the dest, e.g. "budget", "reserve", "dropoff", "num_rounds",
+# "mechanism", "max_perms", "iters") plus "agents", a list of agent specs
+# like ["Truthful,3", "seniorspringbb,2"].  Keys whose value is a list
+# are swept; anything else is fixed for every cell.  "agents" is always
+# swept, so it is a list of agent spec lists.  For example
+#
+#   {"agents": [["Truthful,3", "seniorspringbb,2"], ["seniorspringbb,5"]],
+#    "reserve": [0, 20, 40], "budget": [500000, 2000],
+#    "iters": 2, "seed": 1}
+#
+# Each cell's aggregate results are stored in the cache directory under a
+# hash of the cell's full config (including the seed) and of the source
+# of the engine and the agents it runs.  Cells already in the cache are
+# skipped, so rerunning an interrupted or extended sweep only computes
+# the missing or changed cells.  A cell without a "seed" is seeded from
+# a hash of its config, so its cached results are reproducible too.
+
+from optparse import OptionParser
+import hashlib
+import itertools
+import json
+import logging
+import modulefinder
+import os
+import random
+import sys
+
+import auction
+
+# Run as a subprocess by remoteagent, so the import graph doesn't show it
+SUBPROCESS_MODULES = ['bidserver']
+
+
+def expand_grid(spec):
+    """Returns the list of cells in spec: dicts of option name -> value,
+    with "agents" giving the agent spec list"""
+    spec = dict(spec)
+    if 'agents' not in spec:
+        spec['agents'] = [['Truthful,3']]
+    axes = sorted(k for (k, v) in spec.items()
+                  if isinstance(v, list) and k != 'agents')
+    fixed = dict((k, v) for (k, v) in spec.items()
+                 if k not in axes and k != 'agents')
+
+    cells = []
+    for agents in spec['agents']:
+        for point in itertools.product(*[spec[k] for k in axes]):
+            cell = dict(fixed)
+            cell.update(zip(axes, point))
+            cell['agents'] = list(agents)
+            cells.append(cell)
+    return cells
+
+
+def cell_options(cell):
+    """Returns (options, agents_to_run) for cell: auction.py's defaults
+    with the cell's values filled in"""
+    (options, _) = auction.build_parser().parse_args([])
+    for (k, v) in cell.items():
+        if k != 'agents':
+            if not hasattr(options, k):
+                raise ValueError("Unknown option in grid spec: %s" % k)
+            setattr(options, k, v)
+    return (options, auction.parse_agents(cell['agents']))
+
+
+def local_modules(agents_to_run):
+    """Names of this directory's modules that a run of agents_to_run can
+    use: everything auction.py and the agent modules import, directly or
+    not, found from their import statements"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    agent_modules = set(name.split(':')[-1].lower() for name in agents_to_run)
+    finder = modulefinder.ModuleFinder(path=[here])
+    for m in ['auction'] + sorted(agent_modules):
+        finder.run_script(os.path.join(here, m + '.py'))
+    found = set(name for (name, module) in finder.modules.items()
+                if module.__file__ and
+                os.path.dirname(os.path.abspath(module.__file__)) == here)
+    found.discard('__main__')
+    # This module too: run_cell decides what goes in the cache
+    return sorted(found | agent_modules | set(['auction', 'sweep']) |
+                  set(SUBPROCESS_MODULES))
+
+
+def source_hash(agents_to_run):
+    """Hash of the source of every module a run of agents_to_run uses"""
+    h = hashlib.sha1()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for m in local_modules(agents_to_run):
+        with open(os.path.join(here, m + '.py'), 'rb') as f:
+            h.update(m)
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def cell_key(cell):
+    """Cache key: the cell's full config and the source it runs"""
+    (options, agents_to_run) = cell_options(cell)
+    config = dict(vars(options))
+    config['agents'] = agents_to_run
+    blob = json.dumps({'config': config,
+                       'source': source_hash(agents_to_run)},
+                      sort_keys=True)
+    return hashlib.sha1(blob).hexdigest()
+
+
+def cell_seed(cell):
+    """The seed of a cell that doesn't give one: from its config, so that
+    the same cell always gets the same random numbers"""
+    blob = json.dumps(cell, sort_keys=True)
+    return int(hashlib.sha1(blob).hexdigest()[:15], 16)
+
+
+def run_cell(cell):
+    """Simulate one cell.  Returns its aggregate results as a dict.
+    Raises ValueError if auction.py would refuse the cell's options."""
+    (options, agents_to_run) = cell_options(cell)
+    if options.seed is None:
+        random.seed(cell_seed(cell))
+    else:
+        random.seed(options.seed)
+    auction.configure(options, agents_to_run)
+    auction.check_options(options, agents_to_run)
+    results = auction.run_permutations(options, agents_to_run)
+    return {'cell': cell,
+            'agents': agents_to_run,
+            'revenue': results.iteration_revenue.mean,
+            'revenue_stddev': results.iteration_revenue.pstddev(),
+            'utility': [s.mean for s in results.utility],
+            'spend': [s.mean for s in results.spend],
+            'distributions': {
+                'revenue': results.revenue.summary(),
+                'utility': [s.summary() for s in results.utility],
+                'spend': [s.summary() for s in results.spend]}}
+
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key + '.json')
+
+
+def write_atomically(path, data):
+    tmp = '%s.tmp.%d' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.rename(tmp, path)
+
+
+def _run_and_store(args):
+    """Pool worker: args is (cell, path).  The per-iteration logging of
+    the cells is silenced."""
+    (cell, path) = args
+    root = logging.getLogger('')
+    level = root.level
+    root.setLevel(logging.ERROR)
+    try:
+        result = run_cell(cell)
+    finally:
+        root.setLevel(level)
+    write_atomically(path, result)
+    return result
+
+
+def sweep(spec, cache_dir, processes=1):
+    """
+    Run every cell of spec that isn't in cache_dir yet, processes at a
+    time.  Returns the results of all the cells, in grid order.
+    """
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    cells = expand_grid(spec)
+    paths = [cache_path(cache_dir, cell_key(c)) for c in cells]
+    todo = [(c, p) for (c, p) in zip(cells, paths) if not os.path.exists(p)]
+    logging.info("%d cells, %d cached, %d to run" % (
+        len(cells), len(cells) - len(todo), len(todo)))
+
+    if processes > 1 and len(todo) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            for (i, _) in enumerate(pool.imap_unordered(_run_and_store, todo)):
+                logging.info("Finished cell %d / %d" % (i + 1, len(todo)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for (i, task) in enumerate(todo):
+            _run_and_store(task)
+            logging.info("Finished cell %d / %d" % (i + 1, len(todo)))
+
+    results = []
+    for p in paths:
+        with open(p) as f:
+            results.append(json.load(f))
+    return results
+
+
+def summary(results):
+    """Returns a line per cell: swept values, revenue and agent utilities"""
+    lines = []
+    for r in results:
+        params = ", ".join("%s=%s" % (k, r['cell'][k])
+                           for k in sorted(r['cell']) if k != 'agents')
+        lines.append("%s [%s]: revenue $%.2f ($%.2f)" % (
+            " ".join(r['cell']['agents']), params,
+            0.01 * r['revenue'], 0.01 * r['revenue_stddev']))
+        for (id, name) in enumerate(r['agents']):
+            lines.append("    Agent %d, %s: utility $%.2f, spend $%.2f" % (
+                id, name, 0.01 * r['utility'][id], 0.01 * r['spend'][id]))
+    return lines
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] GRIDSPEC.json"
+    parser = OptionParser(usage=usage_msg)
+
+    parser.add_option("--cache-dir",
+                      dest="cache_dir", default="sweep-cache",
+                      help="Directory holding the per-cell results")
+
+    parser.add_option("--processes",
+                      dest="processes", default=1, type="int",
+                      help="Number of cells to run in parallel")
+
+    (options, args) = parser.parse_args(args[1:])
+    if len(args) != 1:
+        parser.error("expected a single grid spec file")
+
+    auction.configure_logging('info')
+    with open(args[0]) as f:
+        spec = json.load(f)
+    for line in summary(sweep(spec, options.cache_dir, options.processes)):
+        logging.info(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
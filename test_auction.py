@@ -0,0 +1,328 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+import time
+
+import pytest
+
+from auction import Params, sim, load_modules, is_static_bidder, run_paired
+from auction import build_parser, configure, run_permutations, run_adaptive
+from auction import sim_days, sim_variants, Workspace, is_resettable
+from auction import check_options
+from stats import Stats
+from timing import BidTimer
+from truthful import Truthful
+from seniorspringbb import seniorspringbb
+
+
+def make_config(class_names, values, classes=None, **kwargs):
+    """classes: optional name -> class dict for agents defined here"""
+    classes = classes or {}
+    conf = Params()
+    conf.add('mechanism', 'gsp')
+    conf.add('reserve', 0)
+    conf.add('budget', 500000)
+    conf.add('num_rounds', 48)
+    conf.add('dropoff', 0.75)
+    conf.add('agent_class_names', class_names)
+    conf.add('agent_classes', load_modules(set(class_names) - set(classes)))
+    conf.agent_classes.update(classes)
+    conf.add('agent_values', values)
+    for (k, v) in kwargs.items():
+        conf.add(k, v)
+    return conf
+
+
+class CountingStatic(Truthful):
+    """Static bidder that counts how often it is asked to bid"""
+    static_bid = True
+    calls = 0
+
+    def bid(self, t, history, reserve):
+        CountingStatic.calls += 1
+        return self.value
+
+
+class Drifting(Truthful):
+    """Overrides Truthful.bid, so it must not be treated as static"""
+    def bid(self, t, history, reserve):
+        return self.value - t
+
+
+def test_static_detection():
+    assert is_static_bidder(Truthful(0, 10, 100))
+    assert is_static_bidder(CountingStatic(0, 10, 100))
+    assert not is_static_bidder(Drifting(0, 10, 100))
+    assert not is_static_bidder(seniorspringbb(0, 10, 100))
+
+
+def run_both(conf):
+    random.seed(7)
+    conf.add('static_fast_path', True)
+    fast = sim(conf)
+    random.seed(7)
+    conf.add('static_fast_path', False)
+    slow = sim(conf)
+    return fast, slow
+
+
+def test_fast_path_matches_slow_path():
+    names = ['Truthful', 'Truthful', 'seniorspringbb', 'seniorspringbb']
+    for budget in [500000, 2000]:
+        conf = make_config(names, [60, 90, 120, 150], budget=budget)
+        fast, slow = run_both(conf)
+        for t in range(48):
+            assert fast.round(t).bids == slow.round(t).bids
+            assert fast.round(t).occupants == slow.round(t).occupants
+        assert fast.agents_spent == slow.agents_spent
+
+
+def test_static_bid_called_once():
+    CountingStatic.calls = 0
+    conf = make_config(['CountingStatic', 'CountingStatic'], [50, 80],
+                       classes={'CountingStatic': CountingStatic},
+                       budget=1000)
+    history = sim(conf)
+    assert CountingStatic.calls == 2
+    # Budget binds for the winner, whose bid drops to zero once the
+    # money is gone
+    assert history.agents_spent[1] >= 1000
+    assert history.round(47).bids == [(0, 50), (1, 0)]
+
+
+class Sluggish(Truthful):
+    """Bids above its value, but too slowly to be allowed to"""
+    static_bid = False
+
+    def bid(self, t, history, reserve):
+        time.sleep(0.002)
+        return 2 * self.value
+
+
+def test_bid_time_limit():
+    timer = BidTimer(time_limit=0.001)
+    conf = make_config(['Truthful', 'Sluggish'], [50, 80],
+                       classes={'Sluggish': Sluggish},
+                       num_rounds=4, bid_timer=timer)
+    history = sim(conf)
+    # Every bid() overran, so the initial bid is carried forward
+    for t in range(4):
+        assert history.round(t).bids == [(0, 50), (1, 80)]
+    assert timer.by_agent[(1, 'bid')].overruns == 3
+    assert timer.by_class[('Sluggish', 'bid')].calls == 3
+    assert timer.by_agent[(0, 'bid')].overruns == 0
+
+
+def test_sparse_history_matches_dense():
+    names = ['Truthful'] * 30 + ['seniorspringbb'] * 3
+    values = range(40, 40 + 3 * len(names), 3)
+    dense = sim(make_config(names, values, num_slots=4))
+    sparse = sim(make_config(names, values, num_slots=4,
+                             sparse_history=True))
+    for t in range(48):
+        d, s = dense.round(t), sparse.round(t)
+        assert s.occupants == d.occupants
+        assert s.per_click_payments == d.per_click_payments
+        # Winners plus the first loser, and a summary of the rest
+        assert len(s.bids) == 5
+        assert s.bid_summary.count == len(names) - 5
+        assert d.bid_summary is None
+    assert sparse.agents_spent == dense.agents_spent
+
+
+def test_sparse_history_refuses_dense_agents():
+    names = ['Truthful'] * 5 + ['seniorspringbudget'] * 2
+    conf = make_config(names, range(40, 110, 10), num_slots=2,
+                       sparse_history=True)
+    with pytest.raises(ValueError):
+        sim(conf)
+
+
+def test_paired_runs_share_random_numbers():
+    names = ['Truthful', 'seniorspringbudget', 'seniorspringbudget']
+    conf = make_config(names, None, seed=5, iters=2, max_perms=3,
+                       min_val=25, max_val=175, compare='gsp,gsp,vcg',
+                       compare_reserves=None)
+    (variants, revenue, rev_diff) = run_paired(conf, names)
+    assert variants == [('gsp', 0), ('gsp', 0), ('vcg', 0)]
+    assert revenue[0].n == 6
+    # Same mechanism on the same scenarios and random stream: no difference
+    assert rev_diff[1].mean == 0 and rev_diff[1].variance() == 0
+    assert rev_diff[2].variance() > 0
+
+
+def test_distinct_assignments_weigh_like_all_permutations():
+    names = ['Truthful', 'Truthful', 'Truthful', 'seniorspringbb']
+    results = {}
+    for dedup in [True, False]:
+        (options, _) = build_parser().parse_args(['--iters', '2',
+                                                  '--num-rounds', '6'])
+        options.dedup_perms = dedup
+        configure(options, names)
+        random.seed(2)
+        results[dedup] = run_permutations(options, names)
+    for (a, b) in zip(results[True].utility, results[False].utility):
+        assert a.n == b.n == results[False].revenue.n
+        assert abs(a.mean - b.mean) < 1e-6 * max(1, abs(b.mean))
+
+
+def test_adaptive_stopping():
+    names = ['Truthful', 'Truthful', 'seniorspringbb']
+
+    def adaptive(args):
+        (options, _) = build_parser().parse_args(['--num-rounds', '6'] + args)
+        configure(options, names)
+        random.seed(1)
+        (revenue, utility, spend, reason) = run_adaptive(options, names)
+        assert utility[0].n == spend[2].n == revenue.n
+        return (revenue.n, reason)
+
+    # A width no run reaches
+    assert adaptive(['--ci-width', '0.001', '--max-samples', '12']) == \
+        (12, "sample budget")
+    # Any two samples are precise enough, but min-samples come first
+    assert adaptive(['--ci-width', '1e12', '--min-samples', '5']) == \
+        (5, "target width")
+    (n, reason) = adaptive(['--ci-width', '0.001', '--max-samples', '100000',
+                            '--time-budget', '0.2'])
+    assert reason == "time budget" and 0 < n < 100000
+
+
+class DayCounting(Truthful):
+    """Counts the days it has seen, to show agents outlive a day"""
+    def __init__(self, id, value, budget):
+        Truthful.__init__(self, id, value, budget)
+        self.days = 0
+
+    def initial_bid(self, reserve):
+        self.days += 1
+        return self.value - self.days
+
+
+def test_multi_day_keeps_agents_and_resets_budgets():
+    names = ['DayCounting', 'Truthful', 'Truthful']
+    conf = make_config(names, [150, 100, 80], {'DayCounting': DayCounting},
+                       budget=5000, days=4)
+    random.seed(3)
+    days = list(sim_days(conf))
+    assert len(days) == 4
+    for history in days:
+        assert history.num_rounds() == 48
+        # Each day starts with the whole budget, and runs the top bidder out
+        assert 5000 <= history.agents_spent[0] < 5000 + 80 * 150
+    assert [h.round(0).bids[0] for h in days] == [(0, 149), (0, 148),
+                                                  (0, 147), (0, 146)]
+    random.seed(3)
+    assert list(sim_days(make_config(names, [150, 100, 80],
+                                     {'DayCounting': DayCounting},
+                                     budget=5000)))[0].agents_spent == \
+        days[0].agents_spent
+
+
+def test_day_log(tmpdir):
+    log = str(tmpdir.join('days.csv'))
+    names = ['Truthful', 'seniorspringbudget']
+    (options, _) = build_parser().parse_args(['--iters', '2', '--days', '3',
+                                              '--num-rounds', '6',
+                                              '--day-log', log])
+    configure(options, names)
+    random.seed(4)
+    results = run_permutations(options, names)
+    with open(log) as f:
+        lines = [line.strip().split(',') for line in f]
+    assert lines[0][:4] == ['iteration', 'assignment', 'day', 'revenue']
+    assert len(lines) == 1 + 2 * 2 * 3
+    assert [l[2] for l in lines[1:4]] == ['0', '1', '2']
+    assert results.revenue.n == 2 * 2 * 3
+
+
+def test_snapshot_continues_like_one_run():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbudget']
+    vals = [60, 130, 170]
+    values = dict(enumerate(vals))
+    random.seed(8)
+    whole = Stats(sim(make_config(names, vals)), values).totals()
+    random.seed(8)
+    snapshot = sim(make_config(names, vals), stop=20)
+    assert snapshot.t == 20
+    # A snapshot can be continued more than once
+    for k in range(2):
+        random.seed(k)
+        history = sim(make_config(names, vals), start=snapshot)
+        assert Stats(history, values).totals() == whole
+        assert history.num_rounds() == 48
+
+
+def test_variants_share_prefix():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbb']
+    conf = make_config(names, [60, 130, 170])
+    variants = [{}, {'reserve': 150}, {'mechanism': 'vcg'}]
+    random.seed(9)
+    serial = sim_variants(conf, 24, variants)
+    random.seed(9)
+    parallel = sim_variants(conf, 24, variants, processes=2)
+    assert serial == parallel
+    random.seed(9)
+    assert serial[0] == Stats(sim(conf), {0: 60, 1: 130, 2: 170}).totals()
+    assert serial[1] != serial[0] and serial[2] != serial[0]
+
+
+def test_shadow_mechanisms_leave_the_live_run_alone():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbb']
+    vals = [60, 130, 170]
+    values = dict(enumerate(vals))
+    random.seed(10)
+    plain = sim(make_config(names, vals))
+    random.seed(10)
+    history = sim(make_config(names, vals,
+                              shadow_mechanisms=['gsp', 'vcg']))
+    live = Stats(history, values).totals()
+    assert live == Stats(plain, values).totals()
+    # Same bids, same pricing rule: the same outcome
+    assert Stats(history.shadows['gsp'], values).totals() == live
+    vcg = history.shadows['vcg']
+    assert [vcg.round(t).occupants for t in range(48)] == \
+        [history.round(t).occupants for t in range(48)]
+    assert 0 < vcg.revenue < history.revenue
+    assert abs(sum(vcg.agents_spent) - vcg.revenue) < 1e-6
+
+
+def test_resettable_agents():
+    assert is_resettable(Truthful)
+    assert is_resettable(seniorspringbb)
+    # Inherits Truthful's reset, but with state of its own
+    assert not is_resettable(DayCounting)
+    # Inherits both
+    assert is_resettable(Drifting)
+
+
+def test_workspace_reuses_agents_and_store():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbb']
+    workspace = Workspace()
+    totals = []
+    for vals in [[60, 130, 170], [170, 60, 130], [60, 130, 170]]:
+        conf = make_config(names, vals)
+        random.seed(11)
+        fresh = Stats(sim(conf), dict(enumerate(vals))).totals()
+        random.seed(11)
+        [history] = list(sim_days(conf, workspace))
+        assert Stats(history, dict(enumerate(vals))).totals() == fresh
+        assert [a.value for a in workspace.agents] == vals
+        totals.append(fresh)
+    agents = workspace.agents
+    store = workspace.store
+    list(sim_days(conf, workspace))
+    assert workspace.agents is agents and workspace.store is store
+    assert totals[0] == totals[2]
+
+
+def test_listen_refuses_bid_timing():
+    for extra in [['--time-bids'], ['--bid-time-limit', '5']]:
+        (options, _) = build_parser().parse_args(['--listen', ':0'] + extra)
+        configure(options, ['Truthful'])
+        with pytest.raises(ValueError):
+            check_options(options, ['Truthful'])
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+from StringIO import StringIO
+
+import bench
+
+
+def test_cases_are_reproducible():
+    assert bench.make_case(100, 8, 'some', 'median') == \
+        bench.make_case(100, 8, 'some', 'median')
+    (clicks, reserve, bids) = bench.make_case(10, 2, 'all', 'zero')
+    assert len(clicks) == 2 and reserve == 0
+    assert set(b for (_, b) in bids) == set([50])
+
+
+def test_run_and_check():
+    results = bench.run('^gsp.compute n=3 slots=2 ties=none', repeat=1,
+                        min_time=0.001)
+    assert len(results) == 3 and bench.REFERENCE in results
+    f = StringIO()
+    bench.write_baseline(results, f)
+    f.seek(0)
+    baseline = bench.read_baseline(f)
+    assert bench.regressions(baseline, results, 0.1) == []
+
+    slower = dict((name, 2 * t) for (name, t) in results.items()
+                  if name != bench.REFERENCE)
+    slower[bench.REFERENCE] = results[bench.REFERENCE]
+    slower['new benchmark'] = 1.0
+    slow = bench.regressions(baseline, slower, 0.5)
+    assert sorted(name for (name, _, _) in slow) == \
+        sorted(name for name in results if name != bench.REFERENCE)
+    assert bench.regressions(baseline, slower, 1.5) == []
+
+    # A machine twice as slow at everything: no regressions
+    slower_machine = dict((name, 2 * t) for (name, t) in results.items())
+    assert bench.regressions(baseline, slower_machine, 0.1) == []
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+
+import pytest
+
+import auction
+import checkpoint
+
+AGENTS = ['Truthful', 'Truthful', 'seniorspringbb']
+
+
+class Killed(Exception):
+    pass
+
+
+def run(args, kill_after=None, monkeypatch=None):
+    (options, _) = auction.build_parser().parse_args(args)
+    auction.configure(options, AGENTS)
+    random.seed(7)
+    if kill_after is not None:
+        real_sim = auction.sim
+        calls = [0]
+
+        def dying_sim(config, agents=None, **kwargs):
+            if calls[0] == kill_after:
+                raise Killed()
+            calls[0] += 1
+            return real_sim(config, agents, **kwargs)
+        monkeypatch.setattr(auction, 'sim', dying_sim)
+    try:
+        return auction.run_permutations(options, AGENTS)
+    finally:
+        if monkeypatch is not None:
+            monkeypatch.undo()
+        if options.tracer is not None:
+            options.tracer.close()
+
+
+def summary(results):
+    return ([(s.n, s.mean, s.m2) for s in results.utility + results.spend],
+            [(s.n, s.mean, s.m2, s.quantile(0.5))
+             for s in [results.revenue, results.iteration_revenue]])
+
+
+@pytest.mark.parametrize('extra', [[], ['--all-perms'], ['--perms', '2']])
+def test_resume_matches_uninterrupted(tmpdir, monkeypatch, extra):
+    path = str(tmpdir.join('run.ckpt'))
+    log = str(tmpdir.join('bids.log'))
+    trace = str(tmpdir.join('trace'))
+    args = ['--iters', '3', '--num-rounds', '6', '--bid-log', log,
+            '--trace', trace, '--trace-every-round', '5'] + extra
+    whole = run(args)
+    with open(log) as f:
+        whole_log = f.read()
+    with open(trace) as f:
+        whole_trace = f.read()
+
+    args += ['--checkpoint', path, '--checkpoint-interval', '0']
+    with pytest.raises(Killed):
+        run(args, kill_after=4, monkeypatch=monkeypatch)
+    resumed = run(args + ['--resume'])
+    assert summary(resumed) == summary(whole)
+    with open(log) as f:
+        assert f.read() == whole_log
+    # The trace before the checkpoint is kept, and the sims numbered on
+    with open(trace) as f:
+        assert f.read() == whole_trace
+
+
+def test_resume_other_config(tmpdir):
+    path = str(tmpdir.join('run.ckpt'))
+    run(['--iters', '1', '--num-rounds', '4', '--checkpoint', path])
+    with pytest.raises(ValueError):
+        run(['--iters', '1', '--num-rounds', '5', '--checkpoint', path,
+             '--resume'])
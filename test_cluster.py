@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import auction
+import cluster
+
+AGENTS = ['Truthful', 'Truthful', 'seniorspringbb', 'seniorspringbudget']
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_options(args):
+    (options, _) = auction.build_parser().parse_args(args)
+    auction.configure(options, AGENTS)
+    return options
+
+
+def summary(results):
+    return ([(s.n, s.mean, s.variance()) for s in results.utility + results.spend],
+            [(s.n, s.mean, s.variance())
+             for s in [results.revenue, results.iteration_revenue]])
+
+
+def close(x, y):
+    return abs(x - y) <= 1e-9 * max(1, abs(x), abs(y))
+
+
+def same_totals(a, b):
+    for (x, y) in zip(*[sum(summary(r), []) for r in [a, b]]):
+        assert x[0] == y[0]
+        assert close(x[1], y[1]) and close(x[2], y[2])
+
+
+def run(run, args):
+    random.seed(5)
+    return run(make_options(args), AGENTS)
+
+
+@pytest.mark.parametrize('extra', [[], ['--all-perms'], ['--perms', '4']])
+def test_tasks_match_run_permutations(extra):
+    args = ['--iters', '2', '--num-rounds', '6'] + extra
+    whole = run(auction.run_permutations, args)
+    for size in ['1', '7']:
+        same_totals(run(cluster.run_locally, args + ['--task-size', size]),
+                    whole)
+
+
+def flaky_worker(address, connected, took):
+    """Takes a task and disconnects without answering"""
+    sock = socket.create_connection(address)
+    connected.set()
+    cluster.recv(sock)
+    took.append(cluster.recv(sock)[1])
+    sock.close()
+
+
+def test_workers_match_single_process_run():
+    args = ['--iters', '2', '--num-rounds', '6', '--task-size', '3',
+            '--worker-wait', '30']
+    whole = run(auction.run_permutations, args)
+
+    server = cluster.listen(('localhost', 0))
+    address = server.getsockname()
+    connected = threading.Event()
+    took = []
+    flaky = threading.Thread(target=flaky_worker,
+                             args=(address, connected, took))
+    flaky.start()
+    # Connect it before the real workers so it gets the first task
+    connected.wait()
+    workers = [subprocess.Popen([sys.executable, 'cluster.py',
+                                 '%s:%d' % address], cwd=HERE,
+                                close_fds=True)
+               for k in range(3)]
+    try:
+        results = run(lambda options, agents:
+                      cluster.coordinate(options, agents, server), args)
+    finally:
+        server.close()
+        flaky.join()
+        for w in workers:
+            if w.poll() is None:
+                w.kill()
+    assert took == [0]
+    same_totals(results, whole)
+
+
+def test_coordinator_gives_up_without_workers():
+    server = cluster.listen(('localhost', 0))
+    try:
+        with pytest.raises(RuntimeError):
+            run(lambda options, agents:
+                cluster.coordinate(options, agents, server),
+                ['--iters', '1', '--num-rounds', '4', '--worker-wait', '0.5'])
+    finally:
+        server.close()
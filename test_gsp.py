@@ -71,3 +71,19 @@ def test_bid_ranges():
     assert bid_range(0, reserve) == (22, None)
     assert bid_range(1, reserve) == (22, 22)
     assert bid_range(2, reserve) == (22, 22)
+
+
+def test_top_bids():
+    bids = zip(range(1,6), [10, 12, 18, 14, 20])
+    assert GSP.top_bids(bids, 3) == [(5, 20), (3, 18), (4, 14)]
+    assert GSP.top_bids(bids, 10) == [(5, 20), (3, 18), (4, 14), (2, 12), (1, 10)]
+
+    # Ties at the cutoff are broken at random
+    tied = zip(range(1,6), [10, 20, 10, 10, 5])
+    seen = set()
+    for i in range(200):
+        top = GSP.top_bids(tied, 2)
+        assert top[0] == (2, 20)
+        assert top[1][1] == 10
+        seen.add(top[1][0])
+    assert seen == set([1, 3, 4])
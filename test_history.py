@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+
+import pytest
+
+from auction import sim
+from history import History, Round, RoundWindow, EvictedRoundError
+from stats import Stats
+from test_auction import make_config
+from truthful import Truthful
+
+
+def test_round_window_keeps_last_rounds():
+    w = RoundWindow(3)
+    for t in range(5):
+        w[t] = t * 10
+    assert w.keys() == [2, 3, 4]
+    assert [w[t] for t in w.keys()] == [20, 30, 40]
+    assert w.get(1) is None and w.get(4) == 40
+    with pytest.raises(EvictedRoundError) as e:
+        w[1]
+    assert 'round 1' in str(e.value) and 'last 3' in str(e.value)
+    with pytest.raises(KeyError):
+        w[5]
+
+
+def test_windowed_sim_matches_full_totals():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbudget', 'Truthful']
+    vals = [60, 95, 130, 170]
+    values = dict(enumerate(vals))
+    totals = []
+    for window in [None, 2]:
+        random.seed(7)
+        history = sim(make_config(names, vals, history_window=window))
+        totals.append(Stats(history, values).totals())
+    ((u0, s0, r0), (u1, s1, r1)) = totals
+    assert [round(u, 6) for u in u0] == [round(u, 6) for u in u1]
+    assert s0 == s1
+    assert abs(r0 - r1) < 1e-6
+    assert history.num_rounds() == 48
+    history.round(47)
+    with pytest.raises(EvictedRoundError):
+        history.round(0)
+
+
+def test_records_are_compact():
+    for record in [Round([(0, 5)], [0], [80], [3], [240]),
+                   History.RoundHistory([(0, 5)], [0], [80], [3], [240]),
+                   Truthful(0, 10, 100)]:
+        assert not hasattr(record, '__dict__')
+
+
+def test_round_copies_and_reads_through():
+    bids = {}
+    occupants = {}
+    history = History(bids, occupants, {0: [80]}, {0: [3]}, {0: [240]}, 2)
+    # Filled in after the History is made, as bidserver does
+    bids[0] = [(0, 5), (1, 3)]
+    occupants[0] = [0]
+    r = history.round(0)
+    assert (r.bids, r.occupants, r.slot_payments) == ([(0, 5), (1, 3)], [0],
+                                                       [240])
+    r.bids.append((2, 1))
+    r.occupants[0] = 1
+    assert history.record(0).bids == [(0, 5), (1, 3)]
+    assert history.peek(0)[1] == [0]
+    assert history.num_rounds() == 1 and history.materializations == 1
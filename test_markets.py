@@ -0,0 +1,79 @@
+import random
+
+from auction import build_parser, configure, run_permutations, sim
+from markets import sim_markets, top_slot_clicks
+from stats import Stats
+from timing import BidTimer
+from test_auction import make_config
+
+
+def test_one_market_is_sim():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbb']
+    vals = [60, 130, 170]
+    values = dict(enumerate(vals))
+    random.seed(12)
+    plain = Stats(sim(make_config(names, vals)), values).totals()
+    random.seed(12)
+    history = sim_markets(make_config(names, vals, markets=1))
+    assert Stats(history, values).totals() == plain
+
+
+def test_markets_share_one_budget():
+    names = ['Truthful', 'Truthful', 'Truthful']
+    conf = make_config(names, [150, 120, 90], budget=3000, markets=3,
+                       market_mechanisms='gsp,vcg')
+    random.seed(13)
+    history = sim_markets(conf)
+    assert len(history.markets) == 3
+    assert history.num_rounds() == 3 * 48
+    assert [h.num_rounds() for h in history.markets] == [48, 48, 48]
+    # Market m's round t is round t * 3 + m of the whole day
+    assert history.record(3 * 10 + 2) is history.markets[2].record(10)
+    # Every market sees the same spend
+    assert all(h.agents_spent is history.agents_spent
+               for h in history.markets)
+    paid = [0, 0, 0]
+    for h in history.markets:
+        for t in range(48):
+            r = h.record(t)
+            for (a, p) in zip(r.occupants, r.slot_payments):
+                paid[a] += p
+    assert paid == history.agents_spent
+    # The top bidder runs out across the markets and then bids zero in all
+    assert history.agents_spent[0] >= 3000
+    last = [h.record(47) for h in history.markets]
+    assert all(dict(r.bids)[0] == 0 for r in last)
+
+
+def test_markets_peak_at_different_times():
+    assert top_slot_clicks(0, 2, 0) == 80
+    assert top_slot_clicks(1, 2, 0) == 20
+    assert top_slot_clicks(1, 2, 24) == 80
+
+
+def test_multi_market_run():
+    names = ['Truthful', 'seniorspringbb']
+    (options, _) = build_parser().parse_args(['--iters', '2',
+                                              '--num-rounds', '6',
+                                              '--markets', '4'])
+    configure(options, names)
+    random.seed(14)
+    results = run_permutations(options, names)
+    assert results.metrics.rounds == 2 * 2 * 6 * 4
+    assert results.metrics.mechanism_calls == 2 * 2 * 6 * 4
+
+
+def test_markets_time_bids_and_respect_fast_path():
+    names = ['Truthful', 'seniorspringbb']
+    timer = BidTimer()
+    conf = make_config(names, [150, 90], markets=2, num_rounds=6,
+                       bid_timer=timer)
+    random.seed(15)
+    history = sim_markets(conf)
+    # Truthful bids once after round 0; seniorspringbb once per market
+    assert timer.by_agent[(0, 'bid')].calls == 2
+    assert timer.by_agent[(1, 'bid')].calls == 2 * 5
+    assert history.metrics.cache_hits == 4
+    conf.static_fast_path = False
+    random.seed(15)
+    assert sim_markets(conf).metrics.cache_hits == 0
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import json
+import random
+from StringIO import StringIO
+
+from auction import build_parser, configure, run_permutations
+from metrics import Metrics
+
+
+def run(names, args):
+    (options, _) = build_parser().parse_args(args)
+    configure(options, names)
+    random.seed(5)
+    return run_permutations(options, names).metrics
+
+
+def test_counts():
+    # 2 iterations x 6 permutations of 3 agents, 10 rounds each
+    m = run(['Truthful', 'seniorspringbb', 'seniorspringbb'],
+            ['--iters', '2', '--num-rounds', '10', '--all-perms'])
+    assert m.sims == 12
+    assert m.rounds == m.mechanism_calls == 120
+    # Per sim: 3 initial bids, the static bidder once more in round 1,
+    # and the two others in each of rounds 1-9; the static bid is reused
+    # in rounds 2-9
+    assert m.agent_calls == 12 * (3 + 1 + 2 * 9)
+    assert m.cache_hits == 12 * 8
+    assert m.history_materializations > 0
+    assert m.peak_history == 10
+    assert m.throughput() > 0
+
+
+def test_merge_and_json():
+    a = Metrics()
+    a.rounds = 10
+    a.peak_history = 48
+    a.phase_time['agents'] = 1.0
+    b = Metrics()
+    b.rounds = 5
+    b.peak_history = 8
+    b.phase_time['agents'] = 0.5
+    a.merge(b)
+    assert (a.rounds, a.peak_history, a.wall_time()) == (15, 48, 1.5)
+    f = StringIO()
+    a.write_json(f)
+    d = json.loads(f.getvalue())
+    assert d['rounds'] == 15 and d['throughput'] == 10.0
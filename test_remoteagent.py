@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import time
+
+import pytest
+
+from auction import sim
+from remoteagent import remote_class, gather_bids
+from test_auction import make_config
+from truthful import Truthful
+
+
+def test_remote_matches_local():
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbb']
+    values = [60, 110, 150]
+    local = sim(make_config(names, values, num_rounds=8))
+    remote = sim(make_config(
+        ['Truthful', 'remote:seniorspringbb', 'remote:seniorspringbb'],
+        values, num_rounds=8))
+    for t in range(8):
+        assert remote.round(t).bids == local.round(t).bids
+
+
+def test_gather_is_concurrent():
+    Slow = remote_class('Truthful', ['--delay', '0.2'])
+    agents = [Slow(i, 50 + i, 1000) for i in range(4)]
+    try:
+        gather_bids(agents, 0, None, 0)  # start the services
+        start = time.time()
+        bids = gather_bids(agents, 0, None, 0)
+        elapsed = time.time() - start
+    finally:
+        for a in agents:
+            a.close()
+    assert bids == {0: 50, 1: 51, 2: 52, 3: 53}
+    # The slowest service, not the sum of all four
+    assert elapsed < 0.6
+
+
+def test_deadline_falls_back_to_previous_bid():
+    Slow = remote_class('Truthful', ['--delay', '0.5'])
+    conf = make_config(['Truthful', 'Slow'], [40, 90], num_rounds=3,
+                       classes={'Slow': Slow}, bid_deadline=0.05)
+    history = sim(conf)
+    # Never answers in time: zero in round 0, carried forward after that
+    for t in range(3):
+        assert history.round(t).bids == [(0, 40), (1, 0)]
+
+
+class Crashing(Truthful):
+    """Fails in round 2"""
+    def bid(self, t, history, reserve):
+        if t == 2:
+            raise RuntimeError("agent crashed")
+        return self.value
+
+
+def test_services_closed_when_sim_fails():
+    started = []
+    Base = remote_class('seniorspringbb')
+
+    class Tracked(Base):
+        def start(self):
+            Base.start(self)
+            started.append(self.process)
+
+    conf = make_config(['Crashing', 'Tracked', 'Tracked'], [40, 90, 120],
+                       num_rounds=5,
+                       classes={'Crashing': Crashing, 'Tracked': Tracked})
+    with pytest.raises(RuntimeError):
+        sim(conf)
+    assert len(started) == 2
+    for process in started:
+        assert process.poll() is not None
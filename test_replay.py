@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import json
+import random
+from StringIO import StringIO
+
+from auction import build_parser, configure, run_permutations, sim
+from replay import replay, read_log, write_history, rounds_from_history
+from stats import Stats
+from test_auction import make_config
+
+
+def test_replay_reproduces_gsp_run():
+    values = {0: 60, 1: 95, 2: 130, 3: 170}
+    names = ['Truthful', 'Truthful', 'seniorspringbb', 'seniorspringbb']
+    history = sim(make_config(names, [values[i] for i in range(4)]))
+    stats = Stats(history, values)
+
+    log = StringIO()
+    write_history(history, values, log)
+    log.seek(0)
+    result = replay(read_log(log), 'gsp', chunk_size=7)
+    assert result.rounds == 48
+    assert result.revenue == stats.total_revenue()
+    for id in range(4):
+        assert result.utility.get(id, 0) == stats.total_utility(id)
+        assert abs(result.spend.get(id, 0) - history.agents_spent[id]) < 1e-6
+
+
+def test_replay_counterfactual():
+    # values (20, 18, 14, 12, 10), clicks [4, 3, 2, 1]; see test_vcg.py
+    bids = zip(range(1,6), [10, 12, 18, 14, 20])
+    values = dict(bids)
+    rounds = [([4, 3, 2, 1], bids, values, 1)] * 3
+
+    gsp = replay(rounds, 'gsp')
+    vcg = replay(rounds, 'vcg')
+    assert gsp.revenue == 3 * (4*18 + 3*14 + 2*12 + 1*10)
+    # per-click payments are rounded down, as in VCG.compute
+    assert vcg.revenue == 3 * (4*(54/4) + 3*(36/3) + 2*(22/2) + 1*10)
+    assert vcg.utility[5] == 3 * 4 * (20 - 54/4)
+
+    # Reserve above everyone but the top bidder
+    high = replay(rounds, 'vcg', reserve=19)
+    assert high.revenue == 3 * 76
+    assert high.spend.keys() == [5]
+
+
+def test_replay_from_history_matches_log():
+    history = sim(make_config(['Truthful'] * 3, [50, 70, 90], num_rounds=6))
+    values = {0: 50, 1: 70, 2: 90}
+    log = StringIO()
+    write_history(history, values, log)
+    log.seek(0)
+    assert (list(read_log(log)) ==
+            [(c, [tuple(b) for b in bids], v, w) for (c, bids, v, w)
+             in rounds_from_history(history, values)])
+
+
+def test_replay_leaves_random_state_alone():
+    bids = zip(range(1,6), [10, 12, 12, 14, 20])
+    rounds = [([4, 3, 2, 1], bids, None, 1)] * 10
+    random.seed(3)
+    expected = random.random()
+    random.seed(3)
+    replay(rounds, 'gsp', chunk_size=3, seed=1)
+    assert random.random() == expected
+
+
+def test_replayed_bid_log_matches_deduplicated_run(tmpdir):
+    log = str(tmpdir.join('bids.log'))
+    agents = ['Truthful', 'Truthful', 'Truthful', 'seniorspringbb']
+    (options, _) = build_parser().parse_args(['--iters', '2',
+                                              '--num-rounds', '6',
+                                              '--bid-log', log])
+    configure(options, agents)
+    random.seed(6)
+    results = run_permutations(options, agents)
+    with open(log) as f:
+        weights = [json.loads(line).get('weight') for line in f]
+    # Fewer sims than permutations: each stands for several
+    assert 6 in weights
+    with open(log) as f:
+        result = replay(read_log(f), 'gsp', seed=1)
+    assert result.rounds == 6 * results.revenue.n
+    assert abs(result.revenue - results.revenue.n * results.revenue.mean) \
+        < 1e-6 * result.revenue
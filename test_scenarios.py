@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import cPickle as pickle
+import math
+import random
+
+import pytest
+
+import auction
+import cluster
+from scenarios import ScenarioSet
+from test_cluster import AGENTS, make_options, same_totals, summary
+
+
+def make_set(path, args, agents=AGENTS):
+    options = make_options(args)
+    random.seed(20)
+    auction.make_scenarios(options, agents, path)
+    return ScenarioSet(path)
+
+
+def test_set_holds_the_runs_scenarios(tmpdir):
+    args = ['--iters', '3', '--num-rounds', '6']
+    scenario_set = make_set(str(tmpdir.join('s')), args)
+    options = make_options(args)
+    random.seed(20)
+    (plan, run_seed) = auction.run_plan(options, AGENTS)
+    assert (scenario_set.plan, scenario_set.run_seed) == (plan, run_seed)
+    for i in range(3):
+        (draw, perms) = auction.assignments(options, 4, plan, run_seed, i)
+        assert scenario_set.draw(i) == draw
+        assert list(scenario_set.assignments(i)) == \
+            [(list(vals), w) for (vals, w) in perms]
+
+
+def test_run_from_set_matches_plain_run(tmpdir):
+    args = ['--iters', '2', '--num-rounds', '6']
+    random.seed(20)
+    plain = auction.run_permutations(make_options(args), AGENTS)
+    options = make_options(args + ['--mech', 'vcg'])
+    options.scenario_set = make_set(str(tmpdir.join('s')), args)
+    # A different global seed: everything comes from the set
+    random.seed(21)
+    options.mechanism = 'gsp'
+    assert summary(auction.run_permutations(options, AGENTS)) == \
+        summary(plain)
+    # The same scenarios through the cluster tasks, the set pickled
+    options = pickle.loads(pickle.dumps(options, pickle.HIGHEST_PROTOCOL))
+    same_totals(cluster.run_locally(options, AGENTS), plain)
+
+
+def test_weights_beyond_64_bits(tmpdir):
+    agents = ['Truthful'] * 22
+    scenario_set = make_set(str(tmpdir.join('s')), ['--iters', '2'], agents)
+    assert scenario_set.weight_size > 8
+    for i in range(2):
+        [(vals, weight)] = list(scenario_set.assignments(i))
+        assert weight == math.factorial(22)
+        assert sorted(vals) == sorted(scenario_set.draw(i))
+
+
+def test_set_checks(tmpdir):
+    path = str(tmpdir.join('s'))
+    scenario_set = make_set(path, ['--iters', '2'])
+    scenario_set.check(AGENTS, 2)
+    with pytest.raises(ValueError):
+        scenario_set.check(AGENTS, 3)
+    with pytest.raises(ValueError):
+        scenario_set.check(AGENTS[:3], 2)
+    # Its assignments are distinct up to swapping the two Truthful agents
+    with pytest.raises(ValueError):
+        scenario_set.check(['Truthful', 'seniorspringbb',
+                            'seniorspringbb', 'Truthful'], 2)
+    other = ['Truthful'] * 4
+    make_set(path, ['--iters', '2', '--all-perms'], other).check(AGENTS, 2)
+    tmpdir.join('bad').write('not a scenario set')
+    with pytest.raises(ValueError):
+        ScenarioSet(str(tmpdir.join('bad')))
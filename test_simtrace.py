@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+from StringIO import StringIO
+
+from auction import sim
+from simtrace import Tracer, read_trace
+from test_auction import make_config
+
+
+def traced(every_sim, every_round, sims):
+    f = StringIO()
+    tracer = Tracer(f, every_sim, every_round)
+    names = ['Truthful', 'seniorspringbb', 'seniorspringbudget']
+    conf = make_config(names, [60, 110, 150], tracer=tracer)
+    histories = [sim(conf) for k in range(sims)]
+    f.seek(0)
+    return (list(read_trace(f)), histories)
+
+
+def test_trace_records_rounds():
+    (records, [history]) = traced(1, 1, 1)
+    assert records[0] == {'sim': 0, 'values': {'0': 60, '1': 110, '2': 150},
+                          'mechanism': 'gsp', 'reserve': 0}
+    rounds = records[1:]
+    assert [r['t'] for r in rounds] == range(48)
+    for r in rounds:
+        h = history.round(r['t'])
+        assert r['occupants'] == h.occupants
+        assert r['payments'] == h.slot_payments
+        assert [tuple(b) for b in r['bids']] == h.bids
+    # Spend through the last round
+    assert rounds[-1]['spent'] == dict(
+        (str(id), s) for (id, s) in enumerate(history.agents_spent))
+
+
+def test_trace_sampling():
+    (records, _) = traced(2, 10, 3)
+    assert [(r['sim'], r.get('t')) for r in records] == (
+        [(0, None)] + [(0, t) for t in range(0, 48, 10)] +
+        [(2, None)] + [(2, t) for t in range(0, 48, 10)])
@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+from auction import sim
+from stats import Stats
+from test_auction import make_config
+
+
+def test_totals_match_per_agent():
+    values = {0: 60, 1: 95, 2: 130, 3: 170}
+    for mech in ['gsp', 'vcg']:
+        names = ['Truthful', 'Truthful', 'seniorspringbb', 'seniorspringbudget']
+        history = sim(make_config(names, [values[i] for i in range(4)],
+                                  mechanism=mech))
+        stats = Stats(history, values)
+        (utility, spend, revenue) = stats.totals()
+        assert utility == [stats.total_utility(id) for id in range(4)]
+        assert revenue == stats.total_revenue()
+        assert abs(sum(spend) - revenue) < 1e-6
+        for id in range(4):
+            assert abs(spend[id] - history.agents_spent[id]) < 1e-6
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import math
+import random
+
+from streamstats import RunningStat
+from util import mean
+
+
+def close(x, y):
+    return abs(x - y) <= 1e-9 * max(1, abs(x), abs(y))
+
+
+def test_running_stat():
+    xs = [random.randint(0, 10000) for i in range(500)]
+    s = RunningStat()
+    for x in xs:
+        s.add(x)
+    m = mean(xs)
+    var = sum((x - m) ** 2 for x in xs) / (len(xs) - 1.0)
+    assert s.n == 500
+    assert close(s.mean, m)
+    assert close(s.variance(), var)
+    assert close(s.ci_halfwidth(), 1.959964 * math.sqrt(var / 500))
+
+
+def test_running_stat_few_samples():
+    s = RunningStat()
+    assert s.ci_halfwidth() == float('inf')
+    s.add(5)
+    assert s.mean == 5 and s.variance() == 0.0
+    assert s.ci_halfwidth() == float('inf')
+
+
+def test_running_stat_merge():
+    xs = [random.uniform(-50, 200) for i in range(1000)]
+    whole = RunningStat()
+    parts = [RunningStat() for i in range(4)]
+    for (i, x) in enumerate(xs):
+        whole.add(x)
+        parts[i % 4].add(x)
+    merged = RunningStat()
+    for p in parts:
+        merged.merge(p)
+    assert merged.n == whole.n
+    assert close(merged.mean, whole.mean)
+    assert close(merged.variance(), whole.variance())
+    assert (merged.min, merged.max) == (min(xs), max(xs))
+
+
+def test_weighted_samples():
+    s = RunningStat()
+    s.add(1, 3)
+    s.add(5)
+    expected = RunningStat()
+    for x in [1, 1, 1, 5]:
+        expected.add(x)
+    assert s.n == 4
+    assert close(s.mean, expected.mean)
+    assert close(s.variance(), expected.variance())
+    assert s.quantile(0.5) == 1
+
+
+def test_quantile_sketch():
+    xs = range(20000)
+    random.shuffle(xs)
+    halves = [RunningStat(), RunningStat()]
+    for (i, x) in enumerate(xs):
+        halves[i % 2].add(x)
+    s = halves[0].merge(halves[1])
+    # Bounded memory, and roughly right
+    assert sum(len(l) for l in s.sketch.levels) < 400
+    for q in [0.05, 0.5, 0.95]:
+        assert abs(s.quantile(q) - q * 20000) < 0.03 * 20000
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import os
+
+import pytest
+
+import sweep
+
+
+def test_expand_grid():
+    spec = {'agents': [['Truthful,2'], ['Truthful', 'seniorspringbb']],
+            'reserve': [0, 10], 'budget': [100, 200], 'iters': 2}
+    cells = sweep.expand_grid(spec)
+    assert len(cells) == 8
+    assert {'agents': ['Truthful,2'], 'reserve': 10, 'budget': 100,
+            'iters': 2} in cells
+
+
+def test_sweep_resumes_from_cache(tmpdir, monkeypatch):
+    cache = str(tmpdir)
+    spec = {'agents': [['Truthful,3']], 'reserve': [0, 30],
+            'num_rounds': 6, 'max_perms': 2, 'seed': 1}
+    first = sweep.sweep(spec, cache)
+    assert len(os.listdir(cache)) == 2
+
+    ran = []
+    real_run_cell = sweep.run_cell
+    def counting_run_cell(cell):
+        ran.append(cell)
+        return real_run_cell(cell)
+    monkeypatch.setattr(sweep, 'run_cell', counting_run_cell)
+
+    # Nothing new: everything comes from the cache
+    assert sweep.sweep(spec, cache) == first
+    assert ran == []
+
+    # Only the added cell is computed
+    spec['reserve'].append(60)
+    results = sweep.sweep(spec, cache)
+    assert results[:2] == first
+    assert [c['reserve'] for c in ran] == [60]
+
+
+def test_cache_key_covers_imported_modules():
+    modules = sweep.local_modules(['Truthful', 'remote:seniorspringbb'])
+    for m in ['auction', 'gsp', 'truthful', 'streamstats', 'timeseries',
+              'remoteagent', 'bidserver', 'timing', 'replay',
+              'seniorspringbb', 'sweep']:
+        assert m in modules
+    assert 'seniorspringbudget' not in modules
+
+
+def test_unseeded_cells_are_reproducible():
+    cell = {'agents': ['Truthful', 'seniorspringbb,2'], 'num_rounds': 6,
+            'iters': 2}
+    assert sweep.run_cell(cell) == sweep.run_cell(dict(cell))
+    other = dict(cell, reserve=10)
+    assert sweep.cell_seed(other) != sweep.cell_seed(cell)
+
+
+def test_cells_are_checked_like_the_command_line():
+    cell = {'agents': ['Truthful,2'], 'history_window': 4,
+            'round_series': 'rounds.csv'}
+    with pytest.raises(ValueError):
+        sweep.run_cell(cell)
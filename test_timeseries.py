@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+from StringIO import StringIO
+
+import pytest
+
+from auction import build_parser, configure, run_permutations
+from timeseries import RoundSeries
+
+
+def close(x, y):
+    return abs(x - y) <= 1e-6 * max(1, abs(x), abs(y))
+
+
+def run(args):
+    (options, _) = build_parser().parse_args(args)
+    agents = ['Truthful', 'Truthful', 'seniorspringbb']
+    configure(options, agents)
+    random.seed(4)
+    return run_permutations(options, agents)
+
+
+def test_round_series_totals():
+    results = run(['--iters', '2', '--num-rounds', '6',
+                   '--round-series', 'unused.csv'])
+    series = results.rounds
+    assert len(series.revenue) == 6
+    assert series.labels == ['Truthful', 'seniorspringbb']
+    # Revenue per round adds up to the revenue per simulation
+    total = sum(r.mean for r in series.revenue)
+    assert close(total, results.revenue.mean)
+    for r in series.revenue:
+        assert r.n == results.revenue.n
+    # Per-class spend is weighted like record()'s, and adds up to it
+    for (ids, spend) in zip(series.columns, zip(*series.spend)):
+        total = results.spend[ids[0]]
+        assert all(s.n == total.n for s in spend)
+        assert close(sum(s.mean for s in spend), total.mean)
+
+    f = StringIO()
+    series.write_csv(f)
+    lines = f.getvalue().strip().split('\n')
+    assert len(lines) == 7
+    assert lines[0].startswith('round,samples,revenue_mean')
+
+
+def test_round_series_merge():
+    a = run(['--iters', '1', '--num-rounds', '4', '--round-series', 'x'])
+    b = run(['--iters', '1', '--num-rounds', '4', '--round-series', 'x',
+             '--reserve', '30'])
+    whole = RoundSeries(a.rounds.columns, a.rounds.labels)
+    for part in [a.rounds, b.rounds]:
+        whole.merge(part)
+    for t in range(4):
+        assert whole.revenue[t].n == a.rounds.revenue[t].n * 2
+        assert close(whole.revenue[t].mean,
+                     (a.rounds.revenue[t].mean + b.rounds.revenue[t].mean) / 2)
+
+
+def test_results_merge_needs_same_sharing():
+    shared = run(['--iters', '1', '--num-rounds', '4'])
+    separate = run(['--iters', '1', '--num-rounds', '4', '--all-perms'])
+    assert shared.sharing() == [0, 0, 2] * 2
+    with pytest.raises(AssertionError):
+        shared.merge(separate)
+    merged = run(['--iters', '1', '--num-rounds', '4']).merge(shared)
+    assert merged.utility[0].n == merged.revenue.n == 2 * shared.revenue.n
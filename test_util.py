@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import itertools
+import math
+
+from util import distinct_assignments
+
+
+def brute_force(values, groups):
+    """Count permutations by their canonical (sorted per group) form"""
+    counts = {}
+    for perm in itertools.permutations(values):
+        key = tuple(tuple(sorted(perm[i] for i in g)) for g in groups)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def check(values, groups):
+    expected = brute_force(values, groups)
+    got = {}
+    for (assignment, mult) in distinct_assignments(values, groups):
+        key = tuple(tuple(sorted(assignment[i] for i in g)) for g in groups)
+        assert key not in got
+        got[key] = mult
+    assert got == expected
+    assert sum(got.values()) == math.factorial(len(values))
+
+
+def test_distinct_assignments():
+    # Truthful,3 seniorspringbb,2
+    check([10, 20, 30, 40, 50], [[0, 1, 2], [3, 4]])
+    # Repeated values
+    check([10, 20, 20, 30, 30], [[0, 1, 2], [3, 4]])
+    check([5, 5, 7, 9], [[0], [1, 2], [3]])
+    # All distinct classes: every permutation
+    check([1, 2, 3, 4], [[0], [1], [2], [3]])
+    # One class: a single assignment
+    assert list(distinct_assignments([3, 1, 2], [[0, 1, 2]])) == [
+        ([1, 2, 3], 6)]
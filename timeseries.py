@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+
+# Per-round statistics across many simulations: how revenue, slot prices
+# and spending evolve over the day, averaged over permutations and value
+# draws.
+
+import csv
+
+from streamstats import RunningStat
+
+
+class RoundSeries:
+    """
+    Running mean and variance, for each round, of the revenue, each
+    slot's per-click price and each column's spend.  A column is a list
+    of agent ids whose spend is pooled (e.g. the agents of one class);
+    by default each agent is its own column.  Memory is O(rounds x
+    (slots + columns)) however many simulations are added.
+    """
+    def __init__(self, columns, labels=None):
+        self.columns = columns
+        self.labels = labels or ["agent%d" % c[0] for c in columns]
+        self.revenue = []   # round -> RunningStat
+        self.price = []     # round -> slot -> RunningStat
+        self.spend = []     # round -> column -> RunningStat
+
+    def add(self, history, weight=1):
+        """Fold in every round of history, counting it weight times.  With
+        columns of several agents, weight must be a multiple of their
+        number."""
+        for t in range(history.num_rounds()):
+            if t == len(self.revenue):
+                self.revenue.append(RunningStat(None))
+                self.price.append([])
+                self.spend.append([RunningStat(None) for c in self.columns])
+            r = history.record(t)
+            self.revenue[t].add(sum(r.slot_payments), weight)
+            prices = self.price[t]
+            while len(prices) < len(r.per_click_payments):
+                prices.append(RunningStat(None))
+            for (s, p) in enumerate(r.per_click_payments):
+                prices[s].add(p, weight)
+            paid = dict(zip(r.occupants, r.slot_payments))
+            for (c, ids) in enumerate(self.columns):
+                # Over the permutations this stands for, each agent of a
+                # column has each of its outcomes weight / len(ids) times
+                # (as in auction.record)
+                w = weight // len(ids)
+                for id in ids:
+                    self.spend[t][c].add(paid.get(id, 0), w)
+
+    def merge(self, other):
+        for t in range(len(other.revenue)):
+            if t == len(self.revenue):
+                self.revenue.append(RunningStat(None))
+                self.price.append([])
+                self.spend.append([RunningStat(None) for c in self.columns])
+            self.revenue[t].merge(other.revenue[t])
+            while len(self.price[t]) < len(other.price[t]):
+                self.price[t].append(RunningStat(None))
+            for (mine, theirs) in zip(self.price[t], other.price[t]):
+                mine.merge(theirs)
+            for (mine, theirs) in zip(self.spend[t], other.spend[t]):
+                mine.merge(theirs)
+        return self
+
+    def write_csv(self, f):
+        """Write one row per round to the open file f: means and standard
+        deviations, in cents.  A slot's price is only averaged over the
+        simulations in which it was filled; its count column says how
+        many (by weight) that was."""
+        num_slots = max([len(p) for p in self.price] + [0])
+        header = ['round', 'samples', 'revenue_mean', 'revenue_sd']
+        for s in range(num_slots):
+            header += ['slot%d_price_mean' % s, 'slot%d_price_sd' % s,
+                       'slot%d_count' % s]
+        for label in self.labels:
+            header += ['spend_%s_mean' % label, 'spend_%s_sd' % label]
+
+        out = csv.writer(f)
+        out.writerow(header)
+        for t in range(len(self.revenue)):
+            row = [t, self.revenue[t].n, self.revenue[t].mean,
+                   self.revenue[t].stddev()]
+            for s in range(num_slots):
+                if s < len(self.price[t]):
+                    p = self.price[t][s]
+                    row += [p.mean, p.stddev(), p.n]
+                else:
+                    row += ['', '', 0]
+            for stat in self.spend[t]:
+                row += [stat.mean, stat.stddev()]
+            out.writerow(row)
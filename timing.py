@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+
+# Wall-clock accounting for agent calls.
+
+import logging
+from timeit import default_timer
+
+
+class CallStats:
+    """Running totals for one kind of call (e.g. all of agent 3's bid calls)"""
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.overruns = 0
+
+    def add(self, elapsed, overrun):
+        self.calls += 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        if overrun:
+            self.overruns += 1
+
+    def mean(self):
+        if self.calls == 0:
+            return 0.0
+        return self.total / self.calls
+
+
+class BidTimer:
+    """
+    Measures the wall time agents spend in initial_bid and bid, aggregated
+    per agent class and per agent id.  One timer can be shared by many
+    simulations so a whole permutation sweep is accounted for.
+
+    If time_limit (in seconds) is set, a call that takes longer has its
+    result thrown away and the fallback bid used instead.  Python can't
+    interrupt a running call, so the limit keeps slow agents from
+    benefiting from their bids rather than bounding how long they run.
+    """
+    def __init__(self, time_limit=None):
+        self.time_limit = time_limit
+        self.by_class = {}   # (class name, method) -> CallStats
+        self.by_agent = {}   # (agent id, method) -> CallStats
+        self.class_of = {}   # agent id -> class name
+
+    def call(self, agent, method, fallback, *args):
+        """Call agent.method(*args), timing it.  Returns its result, or
+        fallback if the call went over the time limit."""
+        start = default_timer()
+        result = getattr(agent, method)(*args)
+        elapsed = default_timer() - start
+
+        overrun = self.time_limit is not None and elapsed > self.time_limit
+        class_name = agent.__class__.__name__
+        self.class_of[agent.id] = class_name
+        for (table, key) in [(self.by_class, (class_name, method)),
+                             (self.by_agent, (agent.id, method))]:
+            if key not in table:
+                table[key] = CallStats()
+            table[key].add(elapsed, overrun)
+
+        if overrun:
+            return fallback
+        return result
+
+    def total_overruns(self):
+        return sum(s.overruns for s in self.by_agent.values())
+
+    def summary(self):
+        """Returns the summary table as a list of lines, slowest first
+        within each section."""
+        header = "%-24s %-12s %8s %10s %10s %10s %8s" % (
+            "agent", "method", "calls", "total ms", "mean us", "max ms",
+            "overrun")
+
+        def rows(table, label):
+            by_total = sorted(table.items(), key=lambda (k, s): -s.total)
+            return ["%-24s %-12s %8d %10.2f %10.1f %10.3f %8d" % (
+                        label(key), method, s.calls, 1e3 * s.total,
+                        1e6 * s.mean(), 1e3 * s.max, s.overruns)
+                    for ((key, method), s) in by_total]
+
+        lines = ["Per-class bid() timing", header]
+        lines.extend(rows(self.by_class, str))
+        lines.append("")
+        lines.append("Per-agent bid() timing")
+        lines.append(header)
+        lines.extend(rows(self.by_agent,
+                          lambda id: "%d (%s)" % (id, self.class_of[id])))
+        if self.time_limit is not None:
+            lines.append("")
+            lines.append("Time limit %.3f ms per call: %d overruns" % (
+                1e3 * self.time_limit, self.total_overruns()))
+        return lines
+
+    def log_summary(self):
+        for line in self.summary():
+            logging.info(line)
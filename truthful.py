@@ -3,13 +3,20 @@
 from gsp import GSP
 from util import argmax_index
 
-class Truthful:
+class Truthful(object):
     """Truthful bidding agent"""
+    __slots__ = ('id', 'value', 'budget')
+
     def __init__(self, id, value, budget):
         self.id = id
         self.value = value
         self.budget = budget
 
+    def reset(self, value, budget):
+        """Get ready for another simulation, as if newly made"""
+        self.value = value
+        self.budget = budget
+
     def initial_bid(self, reserve):
         return self.value
 
@@ -35,3 +35,50 @@ def stddev(lst):
         return 0
     m = mean(lst)
     return math.sqrt(sum((x-m)*(x-m) for x in lst) / len(lst))
+
+def count_values(lst):
+    """Returns a dict value -> number of times it appears in lst"""
+    counts = {}
+    for x in lst:
+        counts[x] = counts.get(x, 0) + 1
+    return counts
+
+def distinct_assignments(values, groups):
+    """
+    groups is a list of lists of positions whose occupants are
+    interchangeable (e.g. agents of the same class).  Yields
+    (assignment, multiplicity) for each distinct way of giving values to
+    the positions, up to reordering within a group: assignment[i] is the
+    value for position i, and multiplicity is how many of the
+    len(values)! permutations of values it stands for.  The
+    multiplicities sum to len(values)!.
+    """
+    def split(g, remaining):
+        if g == len(groups):
+            yield []
+            return
+        seen = set()
+        for part in combinations(remaining, len(groups[g])):
+            if part in seen:
+                continue
+            seen.add(part)
+            rest = list(remaining)
+            for v in part:
+                rest.remove(v)
+            for parts in split(g + 1, rest):
+                yield [part] + parts
+
+    value_perms = 1
+    for c in count_values(values).values():
+        value_perms *= math.factorial(c)
+
+    for parts in split(0, sorted(values)):
+        assignment = [None] * len(values)
+        numerator, denominator = value_perms, 1
+        for (group, part) in zip(groups, parts):
+            for (pos, v) in zip(group, part):
+                assignment[pos] = v
+            numerator *= math.factorial(len(group))
+            for c in count_values(part).values():
+                denominator *= math.factorial(c)
+        yield (assignment, numerator // denominator)
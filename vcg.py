@@ -1,8 +1,6 @@
 
 #!/usr/bin/env python
 
-import random
-
 from gsp import GSP
 
 class VCG:
@@ -28,16 +26,11 @@ class VCG:
         """
 
         # The allocation is the same as GSP, so we filled that in for you...
-        
-        valid = lambda (a, bid): bid >= reserve
-        valid_bids = filter(valid, bids)
-
-        rev_cmp_bids = lambda (a1, b1), (a2, b2): cmp(b2, b1)
-        # shuffle first to make sure we don't have any bias for lower or
-        # higher ids
-        random.shuffle(valid_bids)
-        valid_bids.sort(rev_cmp_bids)
+        return VCG.price(slot_clicks, reserve, GSP.rank(reserve, bids))
 
+    @staticmethod
+    def price(slot_clicks, reserve, valid_bids):
+        """compute, given the bids already ranked (see GSP.rank)"""
         num_slots = len(slot_clicks)
         allocated_bids = valid_bids[:num_slots]
         if len(allocated_bids) == 0: